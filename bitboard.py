@@ -0,0 +1,540 @@
+"""
+Bitboard helpers for End of the Track.
+
+A square is an encoded position in [0, 55] (see BoardState.encode_single_pos) and a set of
+squares is an int with bit `pos` set for every square in the set. Everything that only depends
+on the board geometry is computed once at import time, so move generation is reduced to table
+lookups and mask operations.
+"""
+
+import random
+
+import numpy as np
+
+N_ROWS = 8
+N_COLS = 7
+N_SQUARES = N_ROWS * N_COLS
+
+## Knight offsets as (dcol, drow), in the order BoardState.single_piece_actions has always
+## listed its targets in.
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (2, -1), (2, 1), (-1, -2), (1, -2), (-1, 2), (1, 2))
+
+
+def knight_targets(pos: int):
+    """
+    Computes the on-board knight targets of a single square without using the tables
+
+    Input: an encoded position. Positions outside [0, 55] are decoded the same way
+        BoardState.decode_single_pos decodes them.
+    Output: a list of encoded positions
+    """
+    col, row = pos % N_COLS, pos // N_COLS
+    result = []
+    for dcol, drow in KNIGHT_OFFSETS:
+        c, r = col + dcol, row + drow
+        if 0 <= c < N_COLS and 0 <= r < N_ROWS:
+            result.append(N_COLS * r + c)
+    return result
+
+
+SQUARE_BITS = tuple(1 << pos for pos in range(N_SQUARES))
+KNIGHT_TARGETS = tuple(tuple(knight_targets(pos)) for pos in range(N_SQUARES))
+
+
+def _knight_distances(source: int):
+    """
+    Breadth first search over knight moves from source on the empty board
+    """
+    dist = [-1] * N_SQUARES
+    dist[source] = 0
+    frontier = [source]
+    while frontier:
+        next_frontier = []
+        for pos in frontier:
+            for target in KNIGHT_TARGETS[pos]:
+                if dist[target] < 0:
+                    dist[target] = dist[pos] + 1
+                    next_frontier.append(target)
+        frontier = next_frontier
+    return dist
+
+
+## KNIGHT_DISTANCE[a * N_SQUARES + b] is the minimum number of knight moves from a to b. Knight
+## moves ignore the other pieces, so this is exact for a single block piece.
+KNIGHT_DISTANCE = tuple(d for source in range(N_SQUARES) for d in _knight_distances(source))
+
+def square_bit(pos: int):
+    """
+    Returns the mask of the single square pos, or 0 for positions off the board
+    """
+    return SQUARE_BITS[pos] if 0 <= pos < N_SQUARES else 0
+
+
+def iter_bits(mask: int):
+    """
+    Yields the encoded positions of the set bits of mask in increasing order
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def occupancy(state, player_idx: int):
+    """
+    Returns the mask of squares covered by the block pieces of player_idx
+
+    Inputs:
+        - state, a sequence of 12 encoded positions laid out like BoardState.state
+        - player_idx, 0 or 1
+    """
+    offset = player_idx * 6
+    mask = 0
+    for pos in state[offset:offset + 5]:
+        if 0 <= pos < N_SQUARES:
+            mask |= SQUARE_BITS[pos]
+    return mask
+
+
+def piece_actions(pos: int):
+    """
+    Returns the encoded positions a block piece standing on pos can move to
+    """
+    if 0 <= pos < N_SQUARES:
+        return KNIGHT_TARGETS[pos]
+    return tuple(knight_targets(pos))
+
+
+def block_actions(state, player_idx: int):
+    """
+    Returns the list of (relative_idx, encoded position) actions of the five block pieces
+    of player_idx, in relative_idx order
+    """
+    offset = player_idx * 6
+    result = []
+    for idx in range(5):
+        pos = state[offset + idx]
+        targets = KNIGHT_TARGETS[pos] if 0 <= pos < N_SQUARES else knight_targets(pos)
+        for target in targets:
+            result.append((idx, target))
+    return result
+
+
+## Packed states: slot i of the 12-slot encoded state lives in bits 6*i .. 6*i+5 and the player
+## to move in bit 72, so a whole search state is a single Python int.
+SLOT_BITS = 6
+SLOT_MASK = (1 << SLOT_BITS) - 1
+SIDE_SHIFT = 12 * SLOT_BITS
+SIDE_BIT = 1 << SIDE_SHIFT
+BOARD_BITS = SIDE_BIT - 1
+
+
+def pack_state(board, player_idx: int):
+    """
+    Packs an encoded board (12 positions in [0, 55]) and the player to move into one int
+    """
+    packed = int(player_idx) << SIDE_SHIFT
+    shift = 0
+    for pos in board:
+        packed |= int(pos) << shift
+        shift += SLOT_BITS
+    return packed
+
+
+def unpack_board(packed: int):
+    """
+    Returns the list of 12 encoded positions stored in a packed state
+    """
+    return [(packed >> shift) & SLOT_MASK for shift in range(0, SIDE_SHIFT, SLOT_BITS)]
+
+
+def unpack_state(packed: int):
+    """
+    Inverse of pack_state: returns ((12-tuple of positions), player_idx)
+    """
+    return (tuple(unpack_board(packed)), packed >> SIDE_SHIFT)
+
+
+def apply_action(packed: int, action: tuple):
+    """
+    Returns the packed state reached by the player to move in packed taking action
+    """
+    idx, pos = action
+    shift = ((packed >> SIDE_SHIFT) * 6 + idx) * SLOT_BITS
+    return (packed & ~(SLOT_MASK << shift) | pos << shift) ^ SIDE_BIT
+
+
+## Packed states do not fit in an int64, so arrays of them are stored as (N, 2) int64 words: the low
+## word holds slots 0-5 (pack_state bits 0-35) and the high word slots 6-11 and the player to move
+## (bits 36-72). WORDS_DTYPE views each row as one opaque 16 byte key for np.unique/np.searchsorted;
+## that order is consistent but is not numeric order.
+WORD_SHIFT = 6 * SLOT_BITS
+WORDS_DTYPE = np.dtype("V16")
+_WORD_SHIFTS = np.arange(0, WORD_SHIFT, SLOT_BITS, dtype=np.int64)
+
+
+def pack_states_array(states, players=None):
+    """
+    Packs an (N, 12) array of encoded boards into an (N, 2) int64 array of words
+
+    players, an optional (N,) array with the player to move, is stored like pack_state stores it.
+    Without it the words only describe the boards.
+    """
+    states = np.asarray(states, dtype=np.int64).reshape(-1, 12)
+    words = np.empty((len(states), 2), dtype=np.int64)
+    words[:, 0] = np.bitwise_or.reduce(states[:, :6] << _WORD_SHIFTS, axis=1)
+    words[:, 1] = np.bitwise_or.reduce(states[:, 6:] << _WORD_SHIFTS, axis=1)
+    if players is not None:
+        words[:, 1] |= np.asarray(players, dtype=np.int64) << WORD_SHIFT
+    return words
+
+
+def unpack_states_array(words):
+    """
+    Inverse of pack_states_array: returns ((N, 12) boards, (N,) players)
+    """
+    words = np.asarray(words, dtype=np.int64).reshape(-1, 2)
+    states = np.empty((len(words), 12), dtype=np.int64)
+    states[:, :6] = (words[:, 0:1] >> _WORD_SHIFTS) & SLOT_MASK
+    states[:, 6:] = (words[:, 1:2] >> _WORD_SHIFTS) & SLOT_MASK
+    return states, words[:, 1] >> WORD_SHIFT
+
+
+def words_as_keys(words):
+    """
+    Views (N, 2) packed words as an (N,) array of WORDS_DTYPE keys
+    """
+    return np.ascontiguousarray(words, dtype=np.int64).view(WORDS_DTYPE).reshape(-1)
+
+def _between(a: int, b: int):
+    """
+    Returns the mask of squares strictly between a and b, or -1 if a and b do not share a
+    column, row or diagonal
+    """
+    a_col, a_row = a % N_COLS, a // N_COLS
+    b_col, b_row = b % N_COLS, b // N_COLS
+    dcol, drow = b_col - a_col, b_row - a_row
+    if dcol != 0 and drow != 0 and abs(dcol) != abs(drow):
+        return -1
+
+    step_col = (dcol > 0) - (dcol < 0)
+    step_row = (drow > 0) - (drow < 0)
+    mask = 0
+    col, row = a_col + step_col, a_row + step_row
+    while (col, row) != (b_col, b_row):
+        mask |= SQUARE_BITS[N_COLS * row + col]
+        col, row = col + step_col, row + step_row
+    return mask
+
+
+## BETWEEN[a * N_SQUARES + b] holds the squares strictly between the queen-aligned squares a and b,
+## or -1 when no pass is possible between them.
+BETWEEN = tuple(_between(a, b) for a in range(N_SQUARES) for b in range(N_SQUARES))
+
+
+def iter_ball_reach(state, player_idx: int):
+    """
+    Yields the squares player_idx can pass their ball to this turn, in the order a flood fill
+    over the teammate graph reaches them
+
+    The ball can be passed any number of times along clear lines between the player's
+    block pieces, starting from the ball. Only the opponent's block pieces obstruct a pass.
+    """
+    offset = player_idx * 6
+    opponent = occupancy(state, 1 - player_idx)
+    ball = state[offset + 5]
+    reached = SQUARE_BITS[ball]
+    pending = state[offset:offset + 5]
+    frontier = [ball]
+
+    while frontier and pending:
+        row = frontier.pop() * N_SQUARES
+        remaining = []
+        for pos in pending:
+            bit = SQUARE_BITS[pos]
+            if reached & bit:
+                continue
+            between = BETWEEN[row + pos]
+            if between >= 0 and not between & opponent:
+                reached |= bit
+                frontier.append(pos)
+                yield pos
+            else:
+                remaining.append(pos)
+        pending = remaining
+
+
+def ball_reach_mask(state, player_idx: int):
+    """
+    Returns the mask of squares player_idx can pass their ball to this turn, see iter_ball_reach
+    """
+    mask = 0
+    for pos in iter_ball_reach(state, player_idx):
+        mask |= SQUARE_BITS[pos]
+    return mask
+
+
+def pass_lanes(state, player_idx: int):
+    """
+    Returns the union of the squares strictly between every queen-aligned pair of player_idx's
+    pieces (block pieces and ball). ball_reach_mask can only change when an opponent block
+    piece enters or leaves one of these squares, or when one of the player's own pieces moves.
+    """
+    offset = player_idx * 6
+    nodes = [pos for pos in state[offset:offset + 6] if 0 <= pos < N_SQUARES]
+    mask = 0
+    for i, a in enumerate(nodes):
+        row = a * N_SQUARES
+        for b in nodes[i + 1:]:
+            between = BETWEEN[row + b]
+            if between > 0:
+                mask |= between
+    return mask
+
+def generate_actions(state, player_idx: int):
+    """
+    Returns the list of (relative_idx, encoded position) actions available to player_idx,
+    matching GameSimulator.generate_valid_actions
+    """
+    result = block_actions(state, player_idx)
+    for pos in iter_bits(ball_reach_mask(state, player_idx)):
+        result.append((5, pos))
+    return result
+
+
+## NumPy copies of the tables for the batched generator. Missing knight targets are padded with -1.
+KNIGHT_TABLE = np.array([list(targets) + [-1] * (8 - len(targets)) for targets in KNIGHT_TARGETS], dtype=np.int64)
+BETWEEN_TABLE = np.array(BETWEEN, dtype=np.int64).reshape(N_SQUARES, N_SQUARES)
+
+
+def generate_actions_batch(states, players):
+    """
+    Generates the successors of many states at once
+
+    Inputs:
+        - states, an (N, 12) integer array of on-board encoded states laid out like BoardState.state
+        - players, an (N,) integer array with the player moving in each state
+
+    Outputs: a tuple (offsets, relative_idx, positions, children) in CSR form, where the actions
+        of states[i] are rows offsets[i]:offsets[i+1] of the other arrays:
+        - offsets, an (N+1,) int64 array
+        - relative_idx, an (M,) int64 array
+        - positions, an (M,) int64 array with the encoded target positions
+        - children, an (M, 12) int64 array with the state reached by each action
+        Within a state the actions are in the order generate_actions produces them.
+    """
+    states = np.asarray(states, dtype=np.int64).reshape(-1, 12)
+    players = np.asarray(players, dtype=np.int64).reshape(-1)
+    n = len(states)
+    rows = np.arange(n)[:, None]
+
+    own = states[rows, players[:, None] * 6 + np.arange(6)]
+    opponent = states[rows, (1 - players[:, None]) * 6 + np.arange(5)]
+    opponent_mask = np.bitwise_or.reduce(np.left_shift(1, opponent), axis=1)
+
+    ## Block pieces: every piece has up to 8 knight targets
+    knight = KNIGHT_TABLE[own[:, :5]].reshape(n, 40)
+    knight_valid = knight >= 0
+
+    ## Ball: flood fill over the 6x6 pass graph of ball + teammates
+    between = BETWEEN_TABLE[own[:, :, None], own[:, None, :]]
+    clear = (between >= 0) & ((between & opponent_mask[:, None, None]) == 0)
+    reached = np.zeros((n, 6), dtype=bool)
+    reached[:, 5] = True
+    for _ in range(5):
+        grown = reached | np.any(reached[:, :, None] & clear, axis=1)
+        if np.array_equal(grown, reached):
+            break
+        reached = grown
+
+    ## Each distinct teammate square other than the ball's own square is a ball action,
+    ## listed in increasing square order
+    order = np.argsort(own[:, :5], axis=1, kind="stable")
+    squares = np.take_along_axis(own[:, :5], order, axis=1)
+    ball_valid = np.take_along_axis(reached[:, :5], order, axis=1) & (squares != own[:, 5:6])
+    ball_valid[:, 1:] &= squares[:, 1:] != squares[:, :-1]
+
+    targets = np.concatenate([knight, squares], axis=1)
+    valid = np.concatenate([knight_valid, ball_valid], axis=1)
+
+    parent, column = np.nonzero(valid)
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(valid.sum(axis=1), out=offsets[1:])
+    relative_idx = np.where(column < 40, column // 8, 5)
+    positions = targets[parent, column]
+
+    children = states[parent]
+    children[np.arange(len(parent)), players[parent] * 6 + relative_idx] = positions
+    return offsets, relative_idx, positions, children
+
+
+def termination_batch(states):
+    """
+    Batched BoardState.is_termination_state over an (N, 12) array of on-board encoded states
+
+    A state is terminal if it is valid (no two block pieces of different players share a square
+    and each ball rests on one of its player's block pieces) and white's ball is on the last row
+    or black's ball on the first row. Returns an (N,) boolean array.
+    """
+    states = np.asarray(states, dtype=np.int64).reshape(-1, 12)
+    white, black = states[:, 0:5], states[:, 6:11]
+    valid = ~np.any(white[:, :, None] == black[:, None, :], axis=(1, 2))
+    valid &= np.any(white == states[:, 5:6], axis=1) & np.any(black == states[:, 11:12], axis=1)
+    at_goal = (states[:, 5] // N_COLS == N_ROWS - 1) | (states[:, 11] // N_COLS == 0)
+    return valid & at_goal
+
+
+## Zobrist keys: ZOBRIST[slot * N_SQUARES + pos] is the random 64 bit value of piece slot standing
+## on pos, and a state's key is the XOR of the values of its 12 pieces, plus ZOBRIST_SIDE when
+## player 1 is to move. Moving one piece changes the key by two XORs (three with the side).
+_zobrist_rng = random.Random(0x5EED)
+ZOBRIST = tuple(_zobrist_rng.getrandbits(64) for _ in range(12 * N_SQUARES))
+ZOBRIST_SIDE = _zobrist_rng.getrandbits(64)
+
+
+def zobrist_piece(slot: int, pos: int):
+    """
+    Returns the Zobrist value of piece slot on pos (0 for positions off the board)
+    """
+    if 0 <= pos < N_SQUARES:
+        return ZOBRIST[slot * N_SQUARES + pos]
+    return 0
+
+
+def zobrist_key(board, player_idx: int = 0):
+    """
+    Computes the Zobrist key of an encoded board and the player to move from scratch
+    """
+    key = ZOBRIST_SIDE if player_idx else 0
+    for slot, pos in enumerate(board):
+        key ^= zobrist_piece(slot, int(pos))
+    return key
+
+def successors(packed: int):
+    """
+    Yields (action, child) pairs for every action available in the packed state, where child is
+    the packed state reached by taking action. This is a pure function of its argument.
+    """
+    player_idx = packed >> SIDE_SHIFT
+    flipped = packed ^ SIDE_BIT
+    base_shift = player_idx * 6 * SLOT_BITS
+    for action in generate_actions(unpack_board(packed), player_idx):
+        shift = base_shift + action[0] * SLOT_BITS
+        yield action, flipped & ~(SLOT_MASK << shift) | action[1] << shift
+
+
+def _ray(pos: int, dcol: int, drow: int):
+    col, row = pos % N_COLS + dcol, pos // N_COLS + drow
+    result = []
+    while 0 <= col < N_COLS and 0 <= row < N_ROWS:
+        result.append(N_COLS * row + col)
+        col, row = col + dcol, row + drow
+    return tuple(result)
+
+
+## RAYS[pos] holds the squares seen from pos in each of the 8 queen directions, nearest first
+RAYS = tuple(
+    tuple(ray for ray in (_ray(pos, dcol, drow) for dcol in (-1, 0, 1) for drow in (-1, 0, 1) if dcol or drow) if ray)
+    for pos in range(N_SQUARES)
+)
+
+
+def visible_mask(pos: int, blockers: int):
+    """
+    Returns the squares with no blocker strictly between them and pos, along queen lines
+    """
+    mask = 0
+    for ray in RAYS[pos]:
+        for target in ray:
+            bit = SQUARE_BITS[target]
+            mask |= bit
+            if blockers & bit:
+                break
+    return mask
+
+
+def ball_origin_mask(state, player_idx: int):
+    """
+    Returns the squares player_idx's ball could have been passed from to end up where it is
+
+    The ball must sit on one of the player's block pieces. It may have come from any teammate
+    of the same pass component, or from any other square with a clear line to that component
+    (blocks move without the ball, so the ball can be left behind on a bare square).
+    """
+    offset = player_idx * 6
+    ball = state[offset + 5]
+    if ball not in state[offset:offset + 5]:
+        return 0
+
+    opponent = occupancy(state, 1 - player_idx)
+    reached = ball_reach_mask(state, player_idx)
+    mask = reached
+    for pos in iter_bits(reached | SQUARE_BITS[ball]):
+        mask |= visible_mask(pos, opponent)
+    return mask & ~SQUARE_BITS[ball]
+
+
+def predecessors(packed: int):
+    """
+    Yields (action, parent) pairs such that taking action in the packed state parent leads to packed
+
+    This inverts successors: the player who made the last move is the one not to move in packed.
+    """
+    player_idx = 1 - (packed >> SIDE_SHIFT)
+    flipped = packed ^ SIDE_BIT
+    board = unpack_board(packed)
+    offset = player_idx * 6
+
+    for idx in range(5):
+        pos = board[offset + idx]
+        shift = (offset + idx) * SLOT_BITS
+        cleared = flipped & ~(SLOT_MASK << shift)
+        for origin in KNIGHT_TARGETS[pos]:
+            yield (idx, pos), cleared | origin << shift
+
+    shift = (offset + 5) * SLOT_BITS
+    cleared = flipped & ~(SLOT_MASK << shift)
+    action = (5, board[offset + 5])
+    for origin in iter_bits(ball_origin_mask(board, player_idx)):
+        yield action, cleared | origin << shift
+
+
+def zobrist_successors(packed: int, key: int):
+    """
+    Like successors, but also yields the Zobrist key of every child, updated incrementally
+    from key, the Zobrist key of packed: yields (action, child, child_key)
+    """
+    player_idx = packed >> SIDE_SHIFT
+    flipped = packed ^ SIDE_BIT
+    flipped_key = key ^ ZOBRIST_SIDE
+    offset = player_idx * 6
+    board = unpack_board(packed)
+    for action in generate_actions(board, player_idx):
+        slot = offset + action[0]
+        shift = slot * SLOT_BITS
+        row = slot * N_SQUARES
+        yield (action, flipped & ~(SLOT_MASK << shift) | action[1] << shift,
+               flipped_key ^ ZOBRIST[row + board[slot]] ^ ZOBRIST[row + action[1]])
+
+
+def iter_successors(packed: int):
+    """
+    Lazy version of successors: yields (action, child) pairs one at a time, all block piece moves
+    first and then the ball passes in the order the flood fill reaches the teammates, so a
+    consumer that stops early never pays for the rest of the pass graph.
+    """
+    player_idx = packed >> SIDE_SHIFT
+    flipped = packed ^ SIDE_BIT
+    offset = player_idx * 6
+    board = unpack_board(packed)
+
+    for idx in range(5):
+        shift = (offset + idx) * SLOT_BITS
+        cleared = flipped & ~(SLOT_MASK << shift)
+        for pos in piece_actions(board[offset + idx]):
+            yield (idx, pos), cleared | pos << shift
+
+    shift = (offset + 5) * SLOT_BITS
+    cleared = flipped & ~(SLOT_MASK << shift)
+    for pos in iter_ball_reach(board, player_idx):
+        yield (5, pos), cleared | pos << shift
@@ -0,0 +1,255 @@
+"""
+External memory breadth first search for GameStateProblem.
+
+Every BFS layer lives on local disk, split into hash buckets of one or more parts. Each part
+is a sorted .npy file of packed board words (see bitboard.pack_states_array) that is opened with np.memmap
+(mode "r") whenever it is needed. The player to move is fixed by the depth, so only boards are
+stored.
+
+Building layer d+1:
+    1. Layer d is read back in chunks small enough for the memory budget and expanded with
+       generate_actions_batch. The children of a chunk are deduplicated and appended to one
+       candidate file per bucket.
+    2. A bucket whose candidates do not fit the memory budget is split further: its candidate
+       file is read back in chunks and scattered over as many parts as needed, using bits of
+       the hash that the bucket choice does not use. Each part's candidates are loaded, sorted
+       and deduplicated. Candidates already in an earlier layer with the same player to move
+       are removed by a sorted merge (np.searchsorted on the memory-mapped files). The
+       survivors are written out as the part's file for layer d+1.
+
+The number of parts of every bucket is recorded per layer, so a board is found again by
+hashing it to its bucket and then to its part.
+
+No parent links are stored. Once the goal is found in layer L, the plan is rebuilt backwards:
+for every layer d < L, the predecessors of the current state are generated and the one that is
+present in layer d is kept.
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from bitboard import (generate_actions_batch, pack_state, pack_states_array, predecessors,
+                      unpack_state, unpack_states_array, words_as_keys)
+
+DEFAULT_MEMORY_BUDGET = 256 << 20
+DEFAULT_BUCKETS = 16
+
+## Rough peak memory of expanding one state: up to 45 children with their boards, words and keys
+BYTES_PER_EXPANSION = 45 * 256
+## Rough peak memory of deduplicating one candidate: its words, sort order and unique copy
+_BYTES_PER_CANDIDATE = 96
+_WORD_BYTES = 16
+
+
+def _hashes(words):
+    lo = words[:, 0].astype(np.uint64)
+    hi = words[:, 1].astype(np.uint64)
+    return lo * np.uint64(0x9E3779B97F4A7C15) ^ hi * np.uint64(0xC2B2AE3D27D4EB4F)
+
+
+def _buckets(words, n_buckets):
+    return ((_hashes(words) >> np.uint64(32)) % np.uint64(n_buckets)).astype(np.int64)
+
+
+def _parts(words, n_parts):
+    return ((_hashes(words) & np.uint64(0xFFFFFFFF)) % np.uint64(n_parts)).astype(np.int64)
+
+
+def _sorted_unique(words):
+    _, first = np.unique(words_as_keys(words), return_index=True)
+    return words[first]
+
+
+def _contains(layer, words):
+    """
+    Returns a boolean mask of the rows of words that appear in layer, a sorted (n, 2) array
+    """
+    if not len(layer) or not len(words):
+        return np.zeros(len(words), dtype=bool)
+    layer_keys = words_as_keys(layer)
+    keys = words_as_keys(words)
+    idx = np.minimum(np.searchsorted(layer_keys, keys), len(layer_keys) - 1)
+    return layer_keys[idx] == keys
+
+
+class _LayerFiles:
+    """
+    Paths and memory maps of the part files of every layer in a scratch directory
+    """
+
+    def __init__(self, directory, n_buckets):
+        self.directory = directory
+        self.n_buckets = n_buckets
+        self.sizes = []
+        ## Number of parts of each bucket, per layer
+        self.parts = []
+
+    def path(self, depth, bucket, part):
+        return os.path.join(self.directory, f"layer_{depth}_{bucket}_{part}.npy")
+
+    def candidates_path(self, bucket, part=None):
+        suffix = "" if part is None else f"_{part}"
+        return os.path.join(self.directory, f"candidates_{bucket}{suffix}.bin")
+
+    def write(self, depth, bucket, part, words):
+        if len(words):
+            np.save(self.path(depth, bucket, part), words)
+
+    def read(self, depth, bucket, part):
+        path = self.path(depth, bucket, part)
+        if not os.path.exists(path):
+            return np.empty((0, 2), dtype=np.int64)
+        return np.load(path, mmap_mode="r")
+
+    def files(self, depth):
+        """
+        Yields the memory-mapped part files of layer depth
+        """
+        for bucket, n_parts in enumerate(self.parts[depth]):
+            for part in range(n_parts):
+                yield self.read(depth, bucket, part)
+
+    def contains(self, depth, words):
+        """
+        Returns a boolean mask of the rows of words that are part of layer depth
+        """
+        found = np.zeros(len(words), dtype=bool)
+        buckets = _buckets(words, self.n_buckets)
+        for bucket in np.unique(buckets):
+            rows = np.flatnonzero(buckets == bucket)
+            n_parts = self.parts[depth][bucket]
+            parts = _parts(words[rows], n_parts) if n_parts > 1 else np.zeros(len(rows), dtype=np.int64)
+            for part in np.unique(parts):
+                part_rows = rows[parts == part]
+                found[part_rows] = _contains(self.read(depth, bucket, part), words[part_rows])
+        return found
+
+
+def _candidate_parts(layers, bucket, memory_budget):
+    """
+    Yields the sorted, deduplicated candidates of bucket in parts that fit memory_budget, and
+    removes the candidate files
+    """
+    path = layers.candidates_path(bucket)
+    n_rows = os.path.getsize(path) // _WORD_BYTES
+    chunk_rows = max(1, memory_budget // _BYTES_PER_CANDIDATE)
+    n_parts = -(-n_rows // chunk_rows)
+    if n_parts <= 1:
+        words = _sorted_unique(np.fromfile(path, dtype=np.int64).reshape(-1, 2))
+        os.remove(path)
+        yield words
+        return
+
+    with open(path, "rb") as f:
+        while True:
+            words = np.fromfile(f, dtype=np.int64, count=2 * chunk_rows).reshape(-1, 2)
+            if not len(words):
+                break
+            parts = _parts(words, n_parts)
+            for part in np.unique(parts):
+                with open(layers.candidates_path(bucket, part), "ab") as part_file:
+                    words[parts == part].tofile(part_file)
+    os.remove(path)
+
+    for part in range(n_parts):
+        part_path = layers.candidates_path(bucket, part)
+        if not os.path.exists(part_path):
+            yield np.empty((0, 2), dtype=np.int64)
+            continue
+        words = _sorted_unique(np.fromfile(part_path, dtype=np.int64).reshape(-1, 2))
+        os.remove(part_path)
+        yield words
+
+
+def external_bfs(problem, scratch_dir=None, memory_budget=DEFAULT_MEMORY_BUDGET, n_buckets=DEFAULT_BUCKETS):
+    """
+    Runs a disk backed breadth first search for problem
+
+    Inputs:
+        - problem, a GameStateProblem
+        - scratch_dir, a directory on local disk for the layer files (default: the system temp
+          directory). A private subdirectory is created in it and removed afterwards.
+        - memory_budget, the approximate number of bytes to use for expanding a chunk of a layer
+          or deduplicating a part of a bucket
+        - n_buckets, the number of hash buckets per layer. Buckets whose candidates do not fit
+          memory_budget are split into parts, so this only sets the number of candidate files
+          written during expansion.
+
+    Outputs: the plan in the usual [(state, action), ..., (goal, None)] format, or None
+        if no goal is reachable
+    """
+    init_state = problem.initial_state
+    if problem.create_hash(init_state) in problem.goal_keys:
+        return [(init_state, None)]
+
+    first_player = init_state[1]
+    goal_words = pack_states_array(problem.goal_positions)
+    chunk_size = max(1, memory_budget // BYTES_PER_EXPANSION)
+
+    directory = tempfile.mkdtemp(prefix="external_bfs_", dir=scratch_dir)
+    try:
+        layers = _LayerFiles(directory, n_buckets)
+        init_words = pack_states_array(np.array([init_state[0]]))
+        layers.write(0, _buckets(init_words, n_buckets)[0], 0, init_words)
+        layers.sizes.append(1)
+        layers.parts.append([1] * n_buckets)
+
+        depth = 0
+        while layers.sizes[depth]:
+            player_idx = (first_player + depth) % 2
+            for layer in layers.files(depth):
+                for start in range(0, len(layer), chunk_size):
+                    boards, _ = unpack_states_array(layer[start:start + chunk_size])
+                    _, _, _, children = generate_actions_batch(boards, np.full(len(boards), player_idx))
+                    words = _sorted_unique(pack_states_array(children))
+                    child_buckets = _buckets(words, n_buckets)
+                    for child_bucket in np.unique(child_buckets):
+                        with open(layers.candidates_path(child_bucket), "ab") as f:
+                            words[child_buckets == child_bucket].tofile(f)
+
+            depth += 1
+            size = 0
+            parts = []
+            for bucket in range(n_buckets):
+                if not os.path.exists(layers.candidates_path(bucket)):
+                    parts.append(1)
+                    continue
+                n_parts = 0
+                for part, words in enumerate(_candidate_parts(layers, bucket, memory_budget)):
+                    keep = np.ones(len(words), dtype=bool)
+                    for earlier in range(depth - 2, -1, -2):
+                        keep &= ~layers.contains(earlier, words)
+                    words = words[keep]
+                    layers.write(depth, bucket, part, words)
+                    size += len(words)
+                    n_parts += 1
+                parts.append(n_parts)
+            layers.sizes.append(size)
+            layers.parts.append(parts)
+            found = layers.contains(depth, goal_words)[0]
+
+            if found:
+                return _rebuild_path(layers, depth, goal_words[0], first_player)
+
+        return None
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _rebuild_path(layers, goal_depth, goal_words, first_player):
+    """
+    Walks back from the goal in layer goal_depth, picking a predecessor from each earlier layer
+    """
+    board = unpack_states_array(goal_words)[0][0].tolist()
+    key = pack_state(board, (first_player + goal_depth) % 2)
+    path = [(unpack_state(key), None)]
+    for depth in range(goal_depth - 1, -1, -1):
+        candidates = list(predecessors(key))
+        boards = np.array([unpack_state(parent)[0] for _, parent in candidates])
+        found = np.flatnonzero(layers.contains(depth, pack_states_array(boards)))
+        action, key = candidates[found[0]]
+        path.append((unpack_state(key), action))
+    return list(reversed(path))
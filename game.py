@@ -1,4 +1,7 @@
+import collections
+import time
 import numpy as np
+import bitboard
 
 class BoardState:
     """
@@ -13,14 +16,86 @@ class BoardState:
         self.N_COLS = 7
 
         self.state = np.array([1,2,3,4,5,3,50,51,52,53,54,52])
-        self.decode_state = [self.decode_single_pos(d) for d in self.state]
+
+    @property
+    def state(self):
+        """
+        Read-only view of the encoded state. Change it with update, or replace it as a whole,
+        so the Zobrist key and the move generation caches stay in step with it.
+        """
+        return self._state_view
+
+    @state.setter
+    def state(self, value):
+        """
+        Replacing the whole encoded state copies it, rebuilds decode_state, recomputes the
+        Zobrist key of the board and drops the move generation caches and the undo history
+        """
+        self._state = np.array(value)
+        self._state_view = self._state.view()
+        self._state_view.flags.writeable = False
+        self.decode_state = [self.decode_single_pos(d) for d in self._state]
+        self.zobrist = bitboard.zobrist_key(self._state)
+        self._piece_moves = [None] * 12
+        self._ball_reach = [None, None]
+        self._pass_lanes = [0, 0]
+        self._history = []
 
     def update(self, idx, val):
         """
-        Updates both the encoded and decoded states
+        Updates the encoded and decoded states, the Zobrist key and the move generation caches,
+        and records the change so it can be undone
         """
-        self.state[idx] = val
-        self.decode_state[idx] = self.decode_single_pos(self.state[idx])
+        self._history.append((idx, int(self._state[idx])))
+        self._set(idx, val)
+
+    def undo(self):
+        """
+        Reverts the most recent update that has not been undone yet
+        """
+        idx, val = self._history.pop()
+        self._set(idx, val)
+
+    def _set(self, idx, val):
+        idx = int(idx)
+        old = int(self._state[idx])
+        val = int(val)
+        self.zobrist ^= bitboard.zobrist_piece(idx, old) ^ bitboard.zobrist_piece(idx, val)
+        self._state[idx] = val
+        self.decode_state[idx] = self.decode_single_pos(self._state[idx])
+
+        ## Knight targets only depend on the piece's own square. The moving player's pass graph
+        ## changes with any of their pieces; the opponent's only if the block piece left or
+        ## entered one of the opponent's pass lanes.
+        self._piece_moves[idx] = None
+        player_idx = idx // 6
+        self._ball_reach[player_idx] = None
+        if idx % 6 != 5:
+            changed = bitboard.square_bit(old) | bitboard.square_bit(val)
+            if changed & self._pass_lanes[1 - player_idx]:
+                self._ball_reach[1 - player_idx] = None
+
+    def piece_moves(self, piece_idx):
+        """
+        Returns the cached tuple of encoded positions the block piece at piece_idx can move to
+        """
+        moves = self._piece_moves[piece_idx]
+        if moves is None:
+            moves = bitboard.piece_actions(int(self._state[piece_idx]))
+            self._piece_moves[piece_idx] = moves
+        return moves
+
+    def ball_reach(self, player_idx):
+        """
+        Returns the cached mask of squares player_idx's ball can be passed to
+        """
+        reach = self._ball_reach[player_idx]
+        if reach is None:
+            state = self._state.tolist()
+            reach = bitboard.ball_reach_mask(state, player_idx)
+            self._ball_reach[player_idx] = reach
+            self._pass_lanes[player_idx] = bitboard.pass_lanes(state, player_idx)
+        return reach
 
     def make_state(self):
         """
@@ -87,23 +162,20 @@ class BoardState:
         
         TODO: You need to implement this.
         """
-        p1_ball, p1_pos, p2_ball, p2_pos = self.get_positions()
-
-        for pos in p1_pos:
-            if pos < 0 or pos > self.encode_single_pos((self.N_COLS-1, self.N_ROWS-1)):
-                return False
-            
-            if pos in p2_pos:
-                return False
-            
-        for pos in p2_pos:
-            if pos < 0 or pos > self.encode_single_pos((self.N_COLS-1, self.N_ROWS-1)):
-                return False
-            
-            if pos in p1_pos:
+        state = np.asarray(self.state).tolist()
+        if len(state) != 12:
+            return False
+        last = self.encode_single_pos((self.N_COLS-1, self.N_ROWS-1))
+        for pos in state[0:5] + state[6:11]:
+            if pos < 0 or pos > last:
                 return False
 
-        if p1_ball not in p1_pos or p2_ball not in p2_pos:
+        ## Block pieces of the two players may not share a square, and each ball must rest on
+        ## one of its player's block pieces
+        if bitboard.occupancy(state, 0) & bitboard.occupancy(state, 1):
+            return False
+
+        if state[5] not in state[0:5] or state[11] not in state[6:11]:
             return False
         
         return True
@@ -115,104 +187,17 @@ class BoardState:
         p2_pos = self.state[len(self.state) // 2: len(self.state) - 1]
         return (p1_ball, p1_pos, p2_ball, p2_pos)
     
-    def single_piece_actions(self, piece_idx):
-        pos = self.state[piece_idx]
-        col, row = self.decode_single_pos(pos)
-        result = []
-
-        if col-2 >= 0:
-            if row-1 >= 0:
-                result.append(self.encode_single_pos((col-2, row-1)))
-            
-            if row+1 < self.N_ROWS:
-                result.append(self.encode_single_pos((col-2, row+1)))
-        
-        if col+2 < self.N_COLS:
-            if row-1 >= 0:
-                result.append(self.encode_single_pos((col+2, row-1)))
-            
-            if row+1 < self.N_ROWS:
-                result.append(self.encode_single_pos((col+2, row+1)))
+    def occupancy(self, player_idx):
+        """
+        Returns the bitboard mask of the squares covered by player_idx's block pieces
+        """
+        return bitboard.occupancy(self.state.tolist(), player_idx)
 
-        if row-2 >= 0:
-            if col-1 >= 0:
-                result.append(self.encode_single_pos((col-1, row-2)))
-            
-            if col+1 < self.N_COLS:
-                result.append(self.encode_single_pos((col+1, row-2)))
-        
-        if row+2 < self.N_ROWS:
-            if col-1 >= 0:
-                result.append(self.encode_single_pos((col-1, row+2)))
-            
-            if col+1 < self.N_COLS:
-                result.append(self.encode_single_pos((col+1, row+2)))
-        
-        return result
+    def single_piece_actions(self, piece_idx):
+        return list(self.piece_moves(piece_idx))
     
     def single_ball_actions(self, player_idx):
-        p1_ball, p1_pos, p2_ball, p2_pos = self.get_positions()
-
-        if player_idx == 0:
-            player_pos = set(p1_pos)
-            opponent_pos = set(p2_pos)
-            ball_pos = p1_ball
-        else:
-            player_pos = set(p2_pos)
-            opponent_pos = set(p1_pos)
-            ball_pos = p2_ball
-
-        result = set([ball_pos])
-        self.recurse_ball_actions(result, ball_pos, player_pos, opponent_pos)
-        result.remove(ball_pos)
-        return result
-    
-    def recurse_ball_actions(self, result: set, pos: int, player_pos: set, opponent_pos: set):
-        ball_col, ball_row = self.decode_single_pos(pos)
-
-        for play_pos in player_pos:
-            play_col, play_row = self.decode_single_pos(play_pos)
-
-            if play_pos in result:
-                continue
-
-            if play_col == ball_col:
-                valid = True
-                for opp_pos in opponent_pos:
-                    opp_col, opp_row = self.decode_single_pos(opp_pos)
-                    if opp_col == play_col and (play_row < opp_row < ball_row or play_row > opp_row > ball_row):
-                        valid = False
-                        break
-
-                if valid:
-                    result.add(play_pos)
-                    self.recurse_ball_actions(result, play_pos, player_pos, opponent_pos)
-                
-            if play_row == ball_row:
-                valid = True
-                for opp_pos in opponent_pos:
-                    opp_col, opp_row = self.decode_single_pos(opp_pos)
-                    if opp_row == play_row and (play_col < opp_col < ball_col or play_col > opp_col > ball_col):
-                        valid = False
-                        break
-
-                if valid:
-                    result.add(play_pos)
-                    self.recurse_ball_actions(result, play_pos, player_pos, opponent_pos)
-
-            if abs(play_row - ball_row) == abs(play_col - ball_col):
-                valid = True
-                for opp_pos in opponent_pos:
-                    opp_col, opp_row = self.decode_single_pos(opp_pos)
-
-                    if abs(opp_row - ball_row) == abs(opp_col - ball_col):
-                        if (play_row < opp_row < ball_row or play_row > opp_row > ball_row) and (play_col < opp_col < ball_col or play_col > opp_col > ball_col):
-                            valid = False
-                            break
-
-                if valid:
-                    result.add(play_pos)
-                    self.recurse_ball_actions(result, play_pos, player_pos, opponent_pos)
+        return set(bitboard.iter_bits(self.ball_reach(player_idx)))
 
 
 class Rules:
@@ -262,10 +247,22 @@ class GameSimulator:
         self.current_round = -1 ## The game starts on round 0; white's move on EVEN rounds; black's move on ODD rounds
         self.players = players
 
-    def run(self):
+    def run(self, headless=False, move_log=None, max_rounds=None):
         """
         Runs a game simulation
+
+        With headless, nothing is printed, players get a copy of the incrementally maintained
+        decoded state instead of a freshly built one, and actions are checked with
+        is_legal_action against the move sets cached on the board. An illegal action loses the
+        game instead of raising. A headless game that is not over after max_rounds rounds (None
+        for no limit) ends as a "DRAW".
+
+        move_log, if given, is called as move_log(round, player_idx, action, value) after every
+        validated move, see MoveLog.
         """
+        if headless:
+            return self._run_headless(move_log, max_rounds)
+
         while not self.game_state.is_termination_state():
             ## Determine the round number, and the player who needs to move
             self.current_round += 1
@@ -284,6 +281,8 @@ class GameSimulator:
 
             ## Updates the game state
             self.update(action, player_idx)
+            if move_log is not None:
+                move_log(self.current_round, player_idx, action, value)
 
         ## Player who moved last is the winner
         if player_idx == 0:
@@ -291,6 +290,46 @@ class GameSimulator:
         else:
             return self.current_round, "BLACK", "No issues"
 
+    def _run_headless(self, move_log, max_rounds):
+        board = self.game_state
+        while not board.is_termination_state():
+            if max_rounds is not None and self.current_round + 1 >= max_rounds:
+                return self.current_round, "DRAW", "No issues"
+            self.current_round += 1
+            player_idx = self.current_round % 2
+            action, value = self.players[player_idx].policy(list(board.decode_state))
+
+            if not self.is_legal_action(action, player_idx):
+                if player_idx == 0:
+                    return self.current_round, "BLACK", "White provided an invalid action"
+                else:
+                    return self.current_round, "WHITE", "Black probided an invalid action"
+
+            board.update(player_idx * 6 + action[0], action[1])
+            if move_log is not None:
+                move_log(self.current_round, player_idx, action, value)
+
+        if player_idx == 0:
+            return self.current_round, "WHITE", "No issues"
+        else:
+            return self.current_round, "BLACK", "No issues"
+
+    def is_legal_action(self, action, player_idx: int):
+        """
+        Returns whether action, a (relative_idx, encoded position) tuple, is one of the actions
+        generate_valid_actions returns for player_idx, by looking it up in the knight targets
+        and ball reach cached on the board instead of rebuilding them
+        """
+        try:
+            idx, pos = int(action[0]), int(action[1])
+        except (TypeError, ValueError, IndexError):
+            return False
+        if idx == 5:
+            return 0 <= pos < bitboard.N_SQUARES and bool(self.game_state.ball_reach(player_idx) >> pos & 1)
+        if idx in (0, 1, 2, 3, 4):
+            return pos in self.game_state.piece_moves(player_idx * 6 + idx)
+        return False
+
     def generate_valid_actions(self, player_idx: int):
         """
         Given a valid state, and a player's turn, generate the set of possible actions that player can take
@@ -310,19 +349,32 @@ class GameSimulator:
             
         TODO: You need to implement this.
         """
-        start = len(self.game_state.state) // 2 * player_idx
-        end = len(self.game_state.state) // 2 * (player_idx+1)
+        board = self.game_state
+        offset = player_idx * 6
         result = []
-        for idx in range(start, end):
-            if idx == end-1:
-                for pos in Rules.single_ball_actions(self.game_state, player_idx):
-                    result.append((idx-start, pos))
-            else:
-                for pos in Rules.single_piece_actions(self.game_state, idx):
-                    result.append((idx-start, pos))
+        for idx in range(5):
+            for pos in board.piece_moves(offset + idx):
+                result.append((idx, pos))
+        for pos in bitboard.iter_bits(board.ball_reach(player_idx)):
+            result.append((5, pos))
 
         return result
 
+    @staticmethod
+    def generate_valid_actions_batch(states, players):
+        """
+        Batched version of generate_valid_actions over many encoded states at once
+
+        Inputs:
+            - states, an (N, 12) integer array where each row mirrors a BoardState.state
+            - players, an (N,) integer array with the player moving in each state
+        Outputs:
+            - a tuple (offsets, relative_idx, positions, children); the actions of states[i] are
+              rows offsets[i]:offsets[i+1] of relative_idx, positions and children. See
+              bitboard.generate_actions_batch for details.
+        """
+        return bitboard.generate_actions_batch(states, players)
+
     def validate_action(self, action: tuple, player_idx: int):
         """
         Checks whether or not the specified action can be taken from this state by the specified player
@@ -360,3 +412,67 @@ class GameSimulator:
         offset_idx = player_idx * 6 ## Either 0 or 6
         idx, pos = action
         self.game_state.update(offset_idx + idx, pos)
+
+
+class MoveLog:
+    """
+    Move log sink for GameSimulator.run that collects moves into columns
+
+    Every call appends one row: the game number (set by the caller, see run_headless_games),
+    round, player_idx, relative_idx, position and value.
+    """
+
+    COLUMNS = ("game", "round", "player", "relative_idx", "position", "value")
+
+    def __init__(self):
+        self.game = 0
+        self.columns = {name: [] for name in self.COLUMNS}
+
+    def __call__(self, round_idx, player_idx, action, value):
+        columns = self.columns
+        columns["game"].append(self.game)
+        columns["round"].append(round_idx)
+        columns["player"].append(player_idx)
+        columns["relative_idx"].append(action[0])
+        columns["position"].append(action[1])
+        columns["value"].append(value)
+
+    def __len__(self):
+        return len(self.columns["round"])
+
+    def as_arrays(self):
+        """
+        Returns the columns as a dict of NumPy arrays
+        """
+        return {name: np.array(values) for name, values in self.columns.items()}
+
+
+HeadlessReport = collections.namedtuple("HeadlessReport", ["results", "plies", "seconds", "games_per_second"])
+
+
+def run_headless_games(players, n_games, move_log=None, max_rounds=None):
+    """
+    Plays n_games headless games between players and reports the throughput
+
+    Inputs:
+        - players, the [white, black] players passed to every GameSimulator
+        - n_games, the number of games to play
+        - move_log, an optional move log sink; if it has a game attribute (as MoveLog does) it is
+          set to the game number before each game
+        - max_rounds, the number of rounds after which a game is a draw (None for no limit)
+
+    Outputs: a HeadlessReport with the list of (rounds, winner, status) results of run, the
+        number of moves played, the wall clock time and the number of games per second
+    """
+    results = []
+    plies = 0
+    start = time.perf_counter()
+    for game_idx in range(n_games):
+        if hasattr(move_log, "game"):
+            move_log.game = game_idx
+        result = GameSimulator(players).run(headless=True, move_log=move_log, max_rounds=max_rounds)
+        results.append(result)
+        ## The last round was not played if it ended with an invalid action
+        plies += result[0] + (result[2] == "No issues")
+    seconds = time.perf_counter() - start
+    return HeadlessReport(results, plies, seconds, n_games / seconds if seconds > 0 else float("inf"))
@@ -0,0 +1,131 @@
+"""
+Compact storage for search nodes.
+
+A NodeStore keeps one row per packed state in growable array columns: the two 36/37 bit words
+of the packed state (see bitboard.pack_states_array), the parent's row, the action that led
+here packed into 10 bits and g. Rows are found by packed state through an open addressing
+index of row numbers, so a node costs a few dozen bytes instead of the dictionary entries,
+tuples and ints of a dict based search.
+"""
+
+from array import array
+
+from bitboard import WORD_SHIFT
+
+_WORD_MASK = (1 << WORD_SHIFT) - 1
+_MASK64 = (1 << 64) - 1
+_EMPTY = -1
+
+
+def pack_action(action):
+    """
+    Packs (relative_idx, position) into 10 bits: relative_idx in bits 6-9, position in bits 0-5
+    """
+    return action[0] << 6 | action[1]
+
+
+def unpack_action(packed_action):
+    return (packed_action >> 6, packed_action & 63)
+
+
+def _slot_hash(lo: int, hi: int):
+    h = (lo * 0x9E3779B97F4A7C15 ^ hi * 0xC2B2AE3D27D4EB4F) & _MASK64
+    return h ^ (h >> 31)
+
+
+class NodeStore:
+    """
+    Array backed table of search nodes indexed by packed state
+
+    Columns, all indexed by node id (the insertion order):
+        - lo, hi: the low and high word of the packed state
+        - parent: node id of the parent, -1 for the root
+        - action: the packed action taken in the parent, see pack_action
+        - g: cost of the best known path from the root, below 2^16
+
+    Node ids are 32 bit, which bounds a store to 2^31 - 1 nodes.
+    """
+
+    def __init__(self, capacity=1 << 10):
+        self.lo = array("q")
+        self.hi = array("q")
+        self.parent = array("i")
+        self.action = array("H")
+        self.g = array("H")
+        size = 1
+        while size < 2 * capacity:
+            size <<= 1
+        self.index = array("i", [_EMPTY]) * size
+
+    def __len__(self):
+        return len(self.lo)
+
+    def _probe(self, lo: int, hi: int):
+        """
+        Returns the index slot holding the node with words (lo, hi), or the empty slot where
+        it would go
+        """
+        mask = len(self.index) - 1
+        slot = _slot_hash(lo, hi) & mask
+        index = self.index
+        while True:
+            node = index[slot]
+            if node == _EMPTY or (self.lo[node] == lo and self.hi[node] == hi):
+                return slot
+            slot = (slot + 1) & mask
+
+    def find(self, packed: int):
+        """
+        Returns the node id of the packed state, or -1 if it is not stored
+        """
+        return self.index[self._probe(packed & _WORD_MASK, packed >> WORD_SHIFT)]
+
+    def add(self, packed: int, parent: int, action: int, g: int):
+        """
+        Stores a new packed state, which must not be stored yet, and returns its node id
+        """
+        if 2 * (len(self.lo) + 1) > len(self.index):
+            self._grow()
+        lo, hi = packed & _WORD_MASK, packed >> WORD_SHIFT
+        node = len(self.lo)
+        self.index[self._probe(lo, hi)] = node
+        self.lo.append(lo)
+        self.hi.append(hi)
+        self.parent.append(parent)
+        self.action.append(action)
+        self.g.append(g)
+        return node
+
+    def _grow(self):
+        self.index = array("i", [_EMPTY]) * (2 * len(self.index))
+        mask = len(self.index) - 1
+        for node in range(len(self.lo)):
+            slot = _slot_hash(self.lo[node], self.hi[node]) & mask
+            while self.index[slot] != _EMPTY:
+                slot = (slot + 1) & mask
+            self.index[slot] = node
+
+    def key(self, node: int):
+        """
+        Returns the packed state of a node
+        """
+        return self.lo[node] | self.hi[node] << WORD_SHIFT
+
+    def path(self, node: int):
+        """
+        Returns [(packed state, action), ...] from the root to node, where each action is the
+        one taken in that state and the last action is None
+        """
+        result = [(self.key(node), None)]
+        while self.parent[node] != _EMPTY:
+            action = unpack_action(self.action[node])
+            node = self.parent[node]
+            result.append((self.key(node), action))
+        return list(reversed(result))
+
+    def nbytes(self):
+        """
+        Returns the memory held by the columns and the index
+        """
+        columns = (self.lo, self.hi, self.parent, self.action, self.g, self.index)
+        return sum(column.itemsize * column.buffer_info()[1] for column in columns)
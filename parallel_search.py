@@ -0,0 +1,259 @@
+"""
+Multi-process planning for GameStateProblem: hash distributed A* (HDA*) for single hard
+queries, and solve_many for large batches of independent queries.
+
+In HDA* every packed state is owned by exactly one worker process, chosen by hashing its key. A worker
+keeps the open list, g values and parent links of the states it owns and only ever expands
+those. Children owned by other workers are collected into one batch per destination and
+exchanged through the coordinator between rounds.
+
+Rounds are synchronous. At the start of a round the coordinator knows the smallest f of every
+open state, including the children still in flight, and every worker expands all of its
+states up to that bound. Goals are tested as children are generated: every step costs 1 and
+the heuristic is consistent and 0 at a goal, so a generated goal with f at most the global
+bound can not be beaten through any open state. The worker that generates it returns it at
+once, together with its parent link, and the search stops with an optimal plan without
+waiting for the rest of the layer or for the goal's owner. A worker also ends its part of a
+round after round_size expansions, so the deep children it sends to other workers are
+expanded there before the shallow ties of the bound layer pile up.
+"""
+
+import heapq
+import itertools
+import multiprocessing as mp
+import os
+
+import numpy as np
+
+from bitboard import successors, unpack_state
+from game import BoardState
+
+_MASK64 = (1 << 64) - 1
+
+DEFAULT_ROUND_SIZE = 16
+
+
+def owner(key: int, n_workers: int):
+    """
+    Returns the index of the worker that owns the packed state key
+    """
+    key = (key ^ (key >> 31) ^ (key >> 62)) & _MASK64
+    key = (key * 0xBF58476D1CE4E5B9) & _MASK64
+    return (key ^ (key >> 29)) % n_workers
+
+
+class _Worker:
+    """
+    Open list, g values and parent links of the states owned by one worker
+    """
+
+    def __init__(self, worker_idx, n_workers, heuristic, goal_keys):
+        self.worker_idx = worker_idx
+        self.n_workers = n_workers
+        self.heuristic = heuristic
+        self.goal_keys = goal_keys
+        self.counter = itertools.count()
+        self.open_heap = []
+        self.g_score = {}
+        self.came_from = {}
+        self.closed = set()
+        self.expansions = 0
+
+    def push(self, key, g, parent, f):
+        old_g = self.g_score.get(key)
+        if old_g is not None and g >= old_g:
+            return
+        self.g_score[key] = g
+        self.came_from[key] = parent
+        self.closed.discard(key)
+        heapq.heappush(self.open_heap, (f, -g, next(self.counter), key))
+
+    def min_f(self):
+        """
+        Drops stale entries from the top of the heap and returns the smallest open f
+        """
+        while self.open_heap:
+            _, neg_g, _, key = self.open_heap[0]
+            if key in self.closed or -neg_g != self.g_score[key]:
+                heapq.heappop(self.open_heap)
+                continue
+            return self.open_heap[0][0]
+        return np.inf
+
+    def expand(self, bound, round_size):
+        """
+        Expands the owned open states with f <= bound, deepest first, stopping after round_size
+        expansions
+
+        Returns (goal, outgoing, outgoing_min_f) where goal is (packed goal state, its parent link)
+        for a goal popped or generated within the bound during the round (or None), outgoing maps
+        worker indices to lists of (key, g, (action, parent_key), f) and outgoing_min_f is the
+        smallest f in outgoing.
+        """
+        outgoing = {}
+        outgoing_min_f = np.inf
+        limit = self.expansions + round_size
+        while self.min_f() <= bound and self.expansions < limit:
+            _, neg_g, _, key = heapq.heappop(self.open_heap)
+            if key in self.goal_keys:
+                return (key, self.came_from[key]), outgoing, outgoing_min_f
+            self.closed.add(key)
+            self.expansions += 1
+
+            g = 1 - neg_g
+            for action, new_key in successors(key):
+                f = g + self.heuristic(new_key)
+                if f <= bound and new_key in self.goal_keys:
+                    return (new_key, (action, key)), outgoing, outgoing_min_f
+                dest = owner(new_key, self.n_workers)
+                if dest == self.worker_idx:
+                    self.push(new_key, g, (action, key), f)
+                else:
+                    outgoing.setdefault(dest, []).append((new_key, g, (action, key), f))
+                    outgoing_min_f = min(outgoing_min_f, f)
+        return None, outgoing, outgoing_min_f
+
+
+def _worker_main(conn, worker_idx, n_workers, problem, round_size):
+    worker = _Worker(worker_idx, n_workers, problem.heuristic_fnc, problem.goal_keys)
+    while True:
+        command, payload = conn.recv()
+        if command == "expand":
+            bound, incoming = payload
+            for key, g, parent, f in incoming:
+                worker.push(key, g, parent, f)
+            if bound is None:
+                conn.send((None, {}, worker.min_f()))
+                continue
+            goal, outgoing, outgoing_min_f = worker.expand(bound, round_size)
+            conn.send((goal, outgoing, min(worker.min_f(), outgoing_min_f)))
+        elif command == "parent":
+            conn.send(worker.came_from.get(payload))
+        elif command == "stats":
+            conn.send(worker.expansions)
+        else:
+            conn.close()
+            return
+
+
+def hda_star(problem, n_workers=None, round_size=DEFAULT_ROUND_SIZE):
+    """
+    Runs HDA* for problem on n_workers processes (default: one per CPU), with at most
+    round_size expansions per worker and round, and returns the plan in the usual
+    [(state, action), ..., (goal, None)] format, or None if no goal is reachable.
+
+    problem.expansions is set to the number of states expanded by each worker.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    init_key = problem.create_hash(problem.initial_state)
+
+    connections = []
+    processes = []
+    for worker_idx in range(n_workers):
+        parent_conn, child_conn = mp.Pipe()
+        process = mp.Process(target=_worker_main, args=(child_conn, worker_idx, n_workers, problem, round_size), daemon=True)
+        process.start()
+        child_conn.close()
+        connections.append(parent_conn)
+        processes.append(process)
+
+    try:
+        inboxes = [[] for _ in range(n_workers)]
+        inboxes[owner(init_key, n_workers)].append((init_key, 0, None, problem.heuristic_fnc(init_key)))
+        bound = None
+        goal = None
+
+        while True:
+            for conn, inbox in zip(connections, inboxes):
+                conn.send(("expand", (bound, inbox)))
+            inboxes = [[] for _ in range(n_workers)]
+
+            min_f = np.inf
+            for conn in connections:
+                worker_goal, outgoing, worker_min_f = conn.recv()
+                if worker_goal is not None:
+                    goal = worker_goal
+                min_f = min(min_f, worker_min_f)
+                for dest, batch in outgoing.items():
+                    inboxes[dest].extend(batch)
+
+            if goal is not None or min_f == np.inf:
+                break
+            bound = min_f
+
+        for conn in connections:
+            conn.send(("stats", None))
+        problem.expansions = [conn.recv() for conn in connections]
+
+        if goal is None:
+            return None
+
+        goal, parent = goal
+        path = [(unpack_state(goal), None)]
+        while parent is not None:
+            action, key = parent
+            path.append((unpack_state(key), action))
+            conn = connections[owner(key, n_workers)]
+            conn.send(("parent", key))
+            parent = conn.recv()
+        return list(reversed(path))
+    finally:
+        for conn in connections:
+            conn.send(("stop", None))
+            conn.close()
+        for process in processes:
+            process.join()
+
+
+## Per process state of the solve_many pool, set up once by _init_solver
+_solver = {}
+
+
+def _init_solver(alg, heuristic):
+    """
+    Pool initializer: imports the search module, which builds the move and heuristic tables,
+    once per worker process
+    """
+    ## search imports this module, so it can only be imported once both are loaded
+    from search import GameStateProblem, InfeasibleQuery
+    _solver["problem_cls"] = GameStateProblem
+    _solver["infeasible_cls"] = InfeasibleQuery
+    _solver["alg"] = alg
+    _solver["heuristic"] = heuristic
+
+
+def _board_state(encoded_state):
+    board = BoardState()
+    board.state = np.array(encoded_state)
+    return board
+
+
+def _solve_query(job):
+    idx, initial, goal, player_idx = job
+    try:
+        problem = _solver["problem_cls"](_board_state(initial), _board_state(goal), player_idx)
+        problem.set_search_alg(_solver["alg"], _solver["heuristic"])
+        return idx, problem.search_alg_fnc()
+    except _solver["infeasible_cls"] as error:
+        return idx, error
+
+
+def solve_many(queries, n_workers=None, alg="", heuristic="", chunksize=1):
+    """
+    Solves many independent planning queries on a process pool
+
+    Inputs:
+        - queries, an iterable of (initial BoardState, goal BoardState, player_idx)
+        - n_workers, the number of worker processes (default: one per CPU)
+        - alg, heuristic: passed to GameStateProblem.set_search_alg in every worker
+        - chunksize: number of queries handed to a worker at a time
+
+    Yields (query index, plan) pairs in completion order, where plan is what
+    GameStateProblem.search_alg_fnc returns for that query, or the InfeasibleQuery raised for
+    it so one bad query does not abort the batch.
+    """
+    jobs = ((idx, tuple(int(x) for x in initial.state), tuple(int(x) for x in goal.state), player_idx)
+            for idx, (initial, goal, player_idx) in enumerate(queries))
+    with mp.Pool(n_workers or os.cpu_count() or 1, initializer=_init_solver, initargs=(alg, heuristic)) as pool:
+        for result in pool.imap_unordered(_solve_query, jobs, chunksize):
+            yield result
@@ -0,0 +1,182 @@
+"""
+Persistent cache of optimal plans for GameStateProblem.
+
+Every suffix of an optimal plan is an optimal plan from its first state, so each state on a
+returned plan is stored with its exact distance to the goal and the action the plan takes
+there. Rows are keyed by (packed goal board, packed state) in an sqlite database. A query whose
+initial state is stored is answered by following the stored actions, and the stored distances
+are exact heuristic values for later searches towards the same goal.
+"""
+
+import collections
+import os
+import sqlite3
+
+from bitboard import SIDE_SHIFT, apply_action
+from node_store import pack_action, unpack_action
+
+## Packed states are 73 bits, too wide for an sqlite INTEGER, so they are stored as blobs
+_KEY_BYTES = SIDE_SHIFT // 8 + 1
+
+
+_MASK64 = (1 << 64) - 1
+_FILTER_HASHES = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9)
+
+
+def _blob(key: int):
+    return key.to_bytes(_KEY_BYTES, "little")
+
+
+class _KeyFilter:
+    """
+    Bloom filter over the packed states stored for one goal, so that lookups of states that
+    are not stored never reach sqlite. It is sized for capacity keys, about 16 bits per key.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.n_bits = max(1 << 10, 16 * capacity)
+        self.bits = bytearray(self.n_bits // 8 + 1)
+        self.n_keys = 0
+
+    def _positions(self, key: int):
+        key = (key ^ key >> 64) & _MASK64
+        for multiplier in _FILTER_HASHES:
+            h = (key * multiplier) & _MASK64
+            yield (h ^ h >> 31) % self.n_bits
+
+    def add(self, key: int):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.n_keys += 1
+
+    def __contains__(self, key: int):
+        return all(self.bits[pos >> 3] >> (pos & 7) & 1 for pos in self._positions(key))
+
+
+class PlanCache:
+    """
+    sqlite backed table of (goal, state) -> (distance to goal, next action)
+
+    Goals are packed goal boards (GameStateProblem.goal_board), states are packed states. The
+    default path ":memory:" keeps the cache for the lifetime of the object only; pass a file path
+    to share it between runs and processes. A search asks for the distance of every state it
+    evaluates, so a Bloom filter of the stored states of each goal, built on its first lookup,
+    answers most misses without sqlite, and the last lru_size lookups that pass it are kept in
+    memory. Rows stored by other processes after a goal's filter is built are not seen by this
+    object's distance lookups.
+    """
+
+    def __init__(self, path=":memory:", lru_size=1 << 16):
+        self.path = path
+        self.lru_size = lru_size
+        self._distances = collections.OrderedDict()
+        self._filters = {}
+        self._pid = None
+        self._connection = None
+        self.connection()
+
+    def connection(self):
+        """
+        Returns the sqlite connection of this process, opening a new one after a fork, since an
+        sqlite connection must not be used from a child process
+        """
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS plans ("
+                "goal BLOB NOT NULL, state BLOB NOT NULL, distance INTEGER NOT NULL, action INTEGER, "
+                "PRIMARY KEY (goal, state)) WITHOUT ROWID")
+            self._pid = os.getpid()
+        return self._connection
+
+    def __len__(self):
+        return self.connection().execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+
+    def lookup(self, goal: int, key: int):
+        """
+        Returns (distance, action) for the packed state key, where action is None at the goal,
+        or None if the state is not stored
+        """
+        row = self.connection().execute(
+            "SELECT distance, action FROM plans WHERE goal = ? AND state = ?", (_blob(goal), _blob(key))).fetchone()
+        if row is None:
+            return None
+        distance, action = row
+        return distance, None if action is None else unpack_action(action)
+
+    def distance(self, goal: int, key: int):
+        """
+        Returns the stored distance to goal of the packed state key, or None if it is not stored
+        """
+        key_filter = self._key_filter(goal)
+        if not key_filter.n_keys or key not in key_filter:
+            return None
+        if (goal, key) in self._distances:
+            self._distances.move_to_end((goal, key))
+            return self._distances[goal, key]
+        row = self.connection().execute(
+            "SELECT distance FROM plans WHERE goal = ? AND state = ?", (_blob(goal), _blob(key))).fetchone()
+        distance = None if row is None else row[0]
+        self._distances[goal, key] = distance
+        if len(self._distances) > self.lru_size:
+            self._distances.popitem(last=False)
+        return distance
+
+    def _key_filter(self, goal: int):
+        """
+        Returns the key filter of goal, building it from the stored rows if it is missing or has
+        outgrown its capacity
+        """
+        key_filter = self._filters.get(goal)
+        if key_filter is None or key_filter.n_keys > key_filter.capacity:
+            goal_blob = _blob(goal)
+            connection = self.connection()
+            n_rows = connection.execute("SELECT COUNT(*) FROM plans WHERE goal = ?", (goal_blob,)).fetchone()[0]
+            key_filter = _KeyFilter(2 * n_rows)
+            for state, in connection.execute("SELECT state FROM plans WHERE goal = ?", (goal_blob,)):
+                key_filter.add(int.from_bytes(state, "little"))
+            self._filters[goal] = key_filter
+        return key_filter
+
+    def plan(self, goal: int, key: int):
+        """
+        Returns the stored plan [(packed state, action), ..., (goal state, None)] from the packed
+        state key, or None if key is not stored
+        """
+        entry = self.lookup(goal, key)
+        path = []
+        while entry is not None:
+            _, action = entry
+            path.append((key, action))
+            if action is None:
+                return path
+            key = apply_action(key, action)
+            entry = self.lookup(goal, key)
+        return None
+
+    def store(self, goal: int, path):
+        """
+        Stores every state of path, a plan [(packed state, action), ..., (goal state, None)]
+        that must be optimal. A state that is already stored keeps the shorter distance.
+        """
+        goal_blob = _blob(goal)
+        n_moves = len(path) - 1
+        rows = [(goal_blob, _blob(key), n_moves - i, None if action is None else pack_action(action))
+                for i, (key, action) in enumerate(path)]
+        with self.connection() as connection:
+            connection.executemany(
+                "INSERT INTO plans (goal, state, distance, action) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (goal, state) DO UPDATE SET distance = excluded.distance, action = excluded.action "
+                "WHERE excluded.distance < plans.distance", rows)
+        key_filter = self._filters.get(goal)
+        for key, _ in path:
+            self._distances.pop((goal, key), None)
+            if key_filter is not None:
+                key_filter.add(key)
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+        self._pid = None
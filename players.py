@@ -0,0 +1,435 @@
+"""
+Player policies for GameSimulator.
+
+A player has a policy(decoded_state) method that receives the decoded board (a list of 12
+(col, row) tuples, see BoardState.decode_state) and returns (action, value), where action is
+a (relative_idx, encoded position) tuple.
+"""
+
+import math
+import random
+import time
+
+import numpy as np
+
+from bitboard import N_COLS, N_ROWS, SIDE_SHIFT, ZOBRIST_SIDE
+from bitboard import generate_actions_batch, pack_state, successors, termination_batch, unpack_board
+from game import GameSimulator
+
+
+def simulator_for(decoded_state):
+    """
+    Returns a GameSimulator whose board holds the decoded state, for generating actions
+    """
+    sim = GameSimulator(None)
+    board = sim.game_state
+    board.state = np.array([board.encode_single_pos(cr) for cr in decoded_state])
+    return sim
+
+
+class RandomPlayer:
+    """
+    Plays a uniformly random valid action, seeded for reproducible games
+    """
+
+    def __init__(self, player_idx, seed=None):
+        self.player_idx = player_idx
+        self.rng = random.Random(seed)
+
+    def policy(self, decoded_state):
+        sim = simulator_for(decoded_state)
+        return self.rng.choice(sim.generate_valid_actions(self.player_idx)), None
+
+
+## Scores of the alpha-beta search, from the point of view of the player to move. A won game
+## scores WIN minus its distance in plies from the root, so faster wins score higher.
+WIN = 100000
+_WIN_BOUND = WIN - 1000
+## Scores of tablebase wins and losses, between the positional evaluation and _WIN_BOUND
+_TABLEBASE_SCORE = _WIN_BOUND // 2
+_EXACT, _LOWER, _UPPER = 0, 1, 2
+
+
+class _OutOfBudget(Exception):
+    pass
+
+
+def _ball_rows(board, reach, player_idx):
+    """
+    Rows advanced towards the goal row by player_idx's ball and by the best square it can be
+    passed to
+    """
+    ball_row = int(board.decode_state[player_idx * 6 + 5][1])
+    if player_idx == 0:
+        reach_row = (reach.bit_length() - 1) // N_COLS if reach else ball_row
+        return ball_row, reach_row
+    reach_row = ((reach & -reach).bit_length() - 1) // N_COLS if reach else ball_row
+    return N_ROWS - 1 - ball_row, N_ROWS - 1 - reach_row
+
+
+class AlphaBetaPlayer:
+    """
+    Negamax alpha-beta search with iterative deepening
+
+    Inputs:
+        - player_idx, the player this policy moves for
+        - seed, unused, for the tournament player factory signature
+        - time_budget, the wall clock seconds one move may take (None for no limit)
+        - node_budget, the number of nodes one move may visit (None for no limit)
+        - max_depth, the deepest iteration
+        - table_size, the number of transposition table entries kept before it is cleared
+        - tablebase, an optional tablebase.Tablebase probed at the leaves. Its distances are
+          exact only for the restricted game of its class, so a decided position is scored
+          above any positional evaluation but below every proven win or loss.
+
+    The search deepens one ply at a time until a budget runs out and plays the best move of the
+    last completed iteration. Moves are ordered by the transposition table move, then the two
+    killer moves of the ply, then the history score. Terminal states are detected with
+    BoardState.is_termination_state: the player who moved last won. Other leaves are scored by
+    how far each ball, and the best square it can be passed to, has advanced towards its goal row.
+    """
+
+    def __init__(self, player_idx, seed=None, time_budget=0.1, node_budget=None, max_depth=64,
+                 table_size=1 << 18, tablebase=None):
+        self.player_idx = player_idx
+        self.time_budget = time_budget
+        self.node_budget = node_budget
+        self.max_depth = max_depth
+        self.table_size = table_size
+        self.tablebase = tablebase
+        self.table = {}
+        self.history = {}
+        self.nodes = 0
+        self.depth = 0
+
+    def policy(self, decoded_state):
+        """
+        Returns (action, value) where value is the score of the action for this player
+        """
+        self.sim = simulator_for(decoded_state)
+        self.nodes = 0
+        self.deadline = None if self.time_budget is None else time.perf_counter() + self.time_budget
+        self.killers = [[None, None] for _ in range(self.max_depth + 1)]
+
+        best = None
+        for depth in range(1, self.max_depth + 1):
+            self.root_best = None
+            try:
+                value = self.negamax(depth, 0, -WIN - 1, WIN + 1, self.player_idx)
+            except _OutOfBudget:
+                if best is None and self.root_best is not None:
+                    best = self.root_best
+                break
+            best = (self.root_best[0], value)
+            self.depth = depth
+            if abs(value) > _WIN_BOUND:
+                break
+
+        if best is None:
+            best = (self.sim.generate_valid_actions(self.player_idx)[0], 0)
+        return best
+
+    def _spend_node(self):
+        self.nodes += 1
+        if self.node_budget is not None and self.nodes > self.node_budget:
+            raise _OutOfBudget()
+        if self.deadline is not None and not self.nodes & 63 and time.perf_counter() > self.deadline:
+            raise _OutOfBudget()
+
+    def evaluate(self, player_idx):
+        board = self.sim.game_state
+        if self.tablebase is not None:
+            plies = self.tablebase.probe(board.state, player_idx)
+            if plies is not None:
+                return _TABLEBASE_SCORE - plies if plies % 2 else plies - _TABLEBASE_SCORE
+        own_ball, own_reach = _ball_rows(board, board.ball_reach(player_idx), player_idx)
+        other_ball, other_reach = _ball_rows(board, board.ball_reach(1 - player_idx), 1 - player_idx)
+        return 10 * (own_ball - other_ball) + 3 * (own_reach - other_reach)
+
+    def ordered_actions(self, player_idx, ply, table_action):
+        actions = self.sim.generate_valid_actions(player_idx)
+        history = self.history
+        killers = self.killers[ply]
+
+        def priority(action):
+            if action == table_action:
+                return 1 << 62
+            if action == killers[0] or action == killers[1]:
+                return 1 << 61
+            return history.get((player_idx, action), 0)
+
+        actions.sort(key=priority, reverse=True)
+        return actions
+
+    def negamax(self, depth, ply, alpha, beta, player_idx):
+        self._spend_node()
+        board = self.sim.game_state
+        if board.is_termination_state():
+            return ply - WIN
+        if depth == 0:
+            return self.evaluate(player_idx)
+
+        key = board.zobrist ^ (ZOBRIST_SIDE if player_idx else 0)
+        entry = self.table.get(key)
+        table_action = None
+        if entry is not None:
+            entry_depth, entry_value, flag, table_action = entry
+            if entry_depth >= depth and ply > 0:
+                value = _from_table(entry_value, ply)
+                if flag == _EXACT:
+                    return value
+                if flag == _LOWER and value >= beta:
+                    return value
+                if flag == _UPPER and value <= alpha:
+                    return value
+
+        original_alpha = alpha
+        best_value = -WIN - 1
+        best_action = None
+        offset = player_idx * 6
+        for action in self.ordered_actions(player_idx, ply, table_action):
+            board.update(offset + action[0], action[1])
+            try:
+                value = -self.negamax(depth - 1, ply + 1, -beta, -alpha, 1 - player_idx)
+            finally:
+                board.undo()
+
+            if value > best_value:
+                best_value = value
+                best_action = action
+                if ply == 0:
+                    self.root_best = (action, value)
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                killers = self.killers[ply]
+                if action != killers[0]:
+                    killers[1] = killers[0]
+                    killers[0] = action
+                history_key = (player_idx, action)
+                self.history[history_key] = self.history.get(history_key, 0) + depth * depth
+                break
+
+        if best_value <= original_alpha:
+            flag = _UPPER
+        elif best_value >= beta:
+            flag = _LOWER
+        else:
+            flag = _EXACT
+        if len(self.table) >= self.table_size:
+            self.table.clear()
+        self.table[key] = (depth, _to_table(best_value, ply), flag, best_action)
+        return best_value
+
+
+def _to_table(value, ply):
+    """
+    Stores win scores as distances from the node instead of from the root
+    """
+    if value > _WIN_BOUND:
+        return value + ply
+    if value < -_WIN_BOUND:
+        return value - ply
+    return value
+
+
+def _from_table(value, ply):
+    if value > _WIN_BOUND:
+        return value - ply
+    if value < -_WIN_BOUND:
+        return value + ply
+    return value
+
+
+def random_playouts(states, players, rng, max_plies=200, deadline=None):
+    """
+    Plays one uniformly random game from each of many states, all at once on NumPy arrays
+
+    Inputs:
+        - states, an (N, 12) array of encoded states laid out like BoardState.state
+        - players, an (N,) array with the player to move in each state
+        - rng, a numpy.random.Generator
+        - max_plies, the number of plies after which an unfinished game counts as a draw
+        - deadline, a time.perf_counter() value after which the unfinished games are cut short
+          and count as draws too (None for no limit)
+
+    Outputs: an (N,) float array with white's score of each game: 1 for a white win, 0 for a
+        black win and 0.5 for a draw. As in GameSimulator.run, the player who moved last into a
+        termination state wins.
+    """
+    states = np.array(states, dtype=np.int64).reshape(-1, 12)
+    players = np.array(players, dtype=np.int64).reshape(-1)
+    scores = np.full(len(states), 0.5)
+    active = np.arange(len(states))
+    for _ in range(max_plies):
+        if not len(active) or deadline is not None and time.perf_counter() > deadline:
+            break
+        offsets, _, _, children = generate_actions_batch(states[active], players[active])
+        picks = offsets[:-1] + (rng.random(len(active)) * np.diff(offsets)).astype(np.int64)
+        states[active] = children[picks]
+        done = termination_batch(states[active])
+        scores[active[done]] = 1.0 - players[active[done]]
+        players[active] = 1 - players[active]
+        active = active[~done]
+    return scores
+
+
+class _TreeNode:
+    """
+    Node of the MCTS tree for a packed state; wins are counted for the player who moved into it
+    """
+
+    __slots__ = ("key", "parent", "action", "children", "untried", "visits", "wins", "terminal")
+
+    def __init__(self, key, parent=None, action=None):
+        self.key = key
+        self.parent = parent
+        self.action = action
+        self.children = {}
+        self.untried = None
+        self.visits = 0
+        self.wins = 0.0
+        self.terminal = bool(termination_batch(unpack_board(key))[0])
+
+    @property
+    def mover(self):
+        return 1 - (self.key >> SIDE_SHIFT)
+
+
+class MCTSPlayer:
+    """
+    Monte Carlo tree search with UCT selection and batched random playouts
+
+    Inputs:
+        - player_idx, the player this policy moves for
+        - seed, the seed of the tree and playout random generators
+        - simulations, the number of playouts per move (None for no limit)
+        - time_budget, the wall clock seconds one move may take (None for no limit)
+        - leaves_per_batch, the number of leaves selected before their playouts are run together
+        - rollouts_per_leaf, the number of playouts run from each selected leaf
+        - exploration, the UCT exploration constant
+        - max_rollout_plies, the length after which a playout counts as a draw
+
+    Every batch selects leaves_per_batch leaves with UCT, expanding one new child per leaf. A
+    virtual loss of rollouts_per_leaf visits is added along each selected path so the following
+    selections spread over the tree. The playouts of all leaves run at once in random_playouts,
+    and their results are backed up along the paths. The subtree of the state reached after
+    this player's move and the opponent's reply is reused for the next move.
+
+    rollouts and rollouts_per_second report the playouts of the last move.
+    """
+
+    def __init__(self, player_idx, seed=None, simulations=2048, time_budget=None, leaves_per_batch=16,
+                 rollouts_per_leaf=4, exploration=1.4, max_rollout_plies=200):
+        if simulations is None and time_budget is None:
+            raise ValueError("MCTSPlayer needs a simulation budget or a time budget")
+        self.player_idx = player_idx
+        self.simulations = simulations
+        self.time_budget = time_budget
+        self.leaves_per_batch = leaves_per_batch
+        self.rollouts_per_leaf = rollouts_per_leaf
+        self.exploration = exploration
+        self.max_rollout_plies = max_rollout_plies
+        self.rng = random.Random(seed)
+        self.np_rng = np.random.default_rng(seed)
+        self.root = None
+        self.rollouts = 0
+        self.rollouts_per_second = 0.0
+
+    def policy(self, decoded_state):
+        """
+        Returns (action, value) where value is the fraction of playouts through the action that
+        this player won
+        """
+        board = [N_COLS * row + col for col, row in decoded_state]
+        root = self._reuse(pack_state(board, self.player_idx))
+        start = time.perf_counter()
+        deadline = None if self.time_budget is None else start + self.time_budget
+
+        self.rollouts = 0
+        while True:
+            if self.simulations is not None and self.rollouts >= self.simulations:
+                break
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            self._run_batch(root, deadline)
+        elapsed = time.perf_counter() - start
+        self.rollouts_per_second = self.rollouts / elapsed if elapsed > 0 else 0.0
+
+        if not root.children:
+            self._expand(root)
+        child = max(root.children.values(), key=lambda node: node.visits)
+        self.root = root
+        self.last_action = child.action
+        return child.action, child.wins / child.visits if child.visits else 0.5
+
+    def _reuse(self, key):
+        """
+        Returns the stored subtree for the packed state key, or a new root
+        """
+        if self.root is not None:
+            if self.root.key == key:
+                return self.root
+            child = self.root.children.get(self.last_action)
+            if child is not None:
+                for grandchild in child.children.values():
+                    if grandchild.key == key:
+                        grandchild.parent = None
+                        return grandchild
+        return _TreeNode(key)
+
+    def _expand(self, node):
+        """
+        Adds one untried child to node and returns it, or returns None if there is none left
+        """
+        if node.untried is None:
+            node.untried = list(successors(node.key))
+            self.rng.shuffle(node.untried)
+        if not node.untried:
+            return None
+        action, key = node.untried.pop()
+        child = _TreeNode(key, node, action)
+        node.children[action] = child
+        return child
+
+    def _select(self, node):
+        log_visits = math.log(node.visits)
+        exploration = self.exploration
+        return max(node.children.values(),
+                   key=lambda child: child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits))
+
+    def _run_batch(self, root, deadline=None):
+        n = self.rollouts_per_leaf
+        leaves = []
+        for _ in range(self.leaves_per_batch):
+            node = root
+            while not node.terminal:
+                child = self._expand(node)
+                if child is not None:
+                    node = child
+                    break
+                node = self._select(node)
+
+            ## Virtual loss: the visits are counted now, the wins once the playouts are done
+            leaf = node
+            while node is not None:
+                node.visits += n
+                node = node.parent
+            leaves.append(leaf)
+
+        ## White's total score over the playouts of every non terminal leaf, in order
+        white_scores = iter(())
+        playouts = [leaf for leaf in leaves if not leaf.terminal]
+        if playouts:
+            boards = np.repeat(np.array([unpack_board(leaf.key) for leaf in playouts]), n, axis=0)
+            players = np.repeat([1 - leaf.mover for leaf in playouts], n)
+            scores = random_playouts(boards, players, self.np_rng, self.max_rollout_plies, deadline)
+            white_scores = iter(scores.reshape(-1, n).sum(axis=1))
+
+        for leaf in leaves:
+            white_score = n * (1.0 - leaf.mover) if leaf.terminal else float(next(white_scores))
+            node = leaf
+            while node is not None:
+                node.wins += white_score if node.mover == 0 else n - white_score
+                node = node.parent
+        self.rollouts += n * len(leaves)
@@ -1,6 +1,102 @@
+import collections
+import heapq
+import itertools
 import numpy as np
 import queue
-from game import BoardState, GameSimulator, Rules
+from array import array
+from game import BoardState, Rules
+from parallel_search import DEFAULT_ROUND_SIZE, hda_star
+from node_store import NodeStore, pack_action
+from external_search import BYTES_PER_EXPANSION, DEFAULT_BUCKETS, DEFAULT_MEMORY_BUDGET, external_bfs
+from bitboard import generate_actions_batch, pack_states_array, unpack_states_array, words_as_keys
+from bitboard import BOARD_BITS, KNIGHT_DISTANCE, N_SQUARES, SIDE_SHIFT, SLOT_BITS, pack_state, unpack_board, unpack_state, generate_actions, predecessors, successors
+from bitboard import iter_successors, zobrist_key, zobrist_successors
+
+## Bit 0 of every slot of a packed state
+_SLOT_LOW_BITS = sum(1 << shift for shift in range(0, SIDE_SHIFT, SLOT_BITS))
+
+
+def differing_slots(a: int, b: int):
+    """
+    Returns the number of board slots that differ between two packed states
+    """
+    diff = (a ^ b) & BOARD_BITS
+    diff |= diff >> 1 | diff >> 2 | diff >> 3 | diff >> 4 | diff >> 5
+    return (diff & _SLOT_LOW_BITS).bit_count()
+
+class ZobristTable:
+    """
+    Dictionary of per-state values keyed by 64 bit Zobrist keys
+
+    Every entry also stores the packed state it belongs to, and lookups compare it, so a Zobrist
+    collision can never return another state's value. The rare second state that collides
+    with an occupied key is kept in an overflow dictionary keyed by its packed state.
+    """
+
+    def __init__(self):
+        self.primary = {}
+        self.overflow = {}
+
+    def get(self, key: int, packed: int):
+        entry = self.primary.get(key)
+        if entry is None:
+            return None
+        if entry[0] == packed:
+            return entry[1]
+        return self.overflow.get(packed)
+
+    def put(self, key: int, packed: int, value):
+        entry = self.primary.get(key)
+        if entry is None or entry[0] == packed:
+            self.primary[key] = (packed, value)
+        else:
+            self.overflow[packed] = value
+
+    def __len__(self):
+        return len(self.primary) + len(self.overflow)
+
+class InfeasibleQuery(ValueError):
+    """
+    Raised for a planning query that has no plan
+
+    reasons is a list of human readable descriptions of what rules the query out.
+    """
+
+    def __init__(self, reasons=("no goal state is reachable from the initial state",)):
+        self.reasons = list(reasons)
+        super().__init__("; ".join(self.reasons))
+
+def check_feasibility(initial_board_state, goal_board_state, player_idx):
+    """
+    Cheap checks that rule a planning query out before any search is run
+
+    Inputs:
+        - initial_board_state, goal_board_state: instances of BoardState
+        - player_idx: the player to move in the initial state
+
+    Outputs: a list of reasons the goal can not be reached, empty if none of the checks fails.
+
+    Both players always keep five block pieces and a ball, so each board must hold six
+    positions per player, all of them on the board. Knights move onto any square regardless
+    of occupancy and the ball can always be passed to a block piece moved next to it, so no
+    further invariant rules out a board that passes these checks.
+    """
+    reasons = []
+    if player_idx not in (0, 1):
+        reasons.append(f"player_idx must be 0 or 1, got {player_idx}")
+
+    for name, board in (("initial", initial_board_state), ("goal", goal_board_state)):
+        if len(board.state) != 12:
+            reasons.append(f"{name} board has {len(board.state)} positions instead of 12")
+            continue
+        p1_ball, p1_pos, p2_ball, p2_pos = board.get_positions()
+        for player, ball, blocks in ((0, p1_ball, p1_pos), (1, p2_ball, p2_pos)):
+            if not 0 <= ball < N_SQUARES:
+                reasons.append(f"{name} ball of player {player} is off the board at {ball}")
+            for idx, pos in enumerate(blocks):
+                if not 0 <= pos < N_SQUARES:
+                    reasons.append(f"{name} block piece {idx} of player {player} is off the board at {pos}")
+    return reasons
 
 class Problem:
     """
@@ -50,13 +146,23 @@ class GameStateProblem(Problem):
             - goal_state_set: set([tuple((tuple(goal_board_state.state), 0)), tuple((tuple(goal_board_state.state), 1))])
               ---in otherwords, the goal_state_set allows the goal_board_state.state to be reached on either player 0 or player 1's
               turn.
+
+        Raises InfeasibleQuery if check_feasibility rules the query out; a search that runs out
+        of states raises it as well.
         """
+        reasons = check_feasibility(initial_board_state, goal_board_state, player_idx)
+        if reasons:
+            raise InfeasibleQuery(reasons)
         super().__init__(tuple((tuple(initial_board_state.state), player_idx)), set([tuple((tuple(goal_board_state.state), 0)), tuple((tuple(goal_board_state.state), 1))]))
-        self.sim = GameSimulator(None)
+        self.goal_keys = set(pack_state(s, p) for s, p in self.goal_state_set)
+        self.goal_board = pack_state(goal_board_state.state, 0)
+        self.goal_positions = unpack_board(self.goal_board)
         self.search_alg_fnc = None
+        self.heuristic_fnc = None
         self.set_search_alg()
 
-    def set_search_alg(self, alg=""):
+    def set_search_alg(self, alg="", heuristic="", early_goal_test=False, plan_cache=None,
+                       transposition_table=None):
         """
         If you decide to implement several search algorithms, and you wish to switch between them,
         pass a string as a parameter to alg, and then set:
@@ -64,8 +170,87 @@ class GameStateProblem(Problem):
         to indicate which algorithm you'd like to run.
 
         TODO: You need to set self.search_alg_fnc here
+
+        Available algorithms:
+            - "" or "heap_a_star": A* on a binary heap with a closed set (the default)
+            - "a_star": A* on queue.PriorityQueue
+            - "bfs": breadth first search
+            - "bidirectional": breadth first search from both ends, meeting in the middle
+            - "ida_star": iterative deepening A*, memory proportional to the plan length
+            - "vector_bfs": level synchronous breadth first search on NumPy arrays of packed states
+            - "hda_star": hash distributed A* on one worker process per CPU
+            - "zobrist_a_star": heap A* with its tables keyed by incrementally updated Zobrist keys
+            - "lazy_bfs": breadth first search over packed states with a visited set
+            - "store_a_star": A* with a bucketed open list and its nodes in an array backed NodeStore
+            - "external_bfs": breadth first search with its layers in memory-mapped files on disk
+
+        Available heuristics for the A* variants:
+            - "" or "knight": knight distance of every block piece plus ball relocation, combined
+              over the alternating turns (the default)
+            - "hamming": number of slots that differ from the goal
+        Unknown names fall back to the default.
+
+        With early_goal_test, "heap_a_star" and "lazy_bfs" generate successors lazily and stop
+        as soon as a goal state is generated instead of when it is popped ("heap_a_star" takes the
+        successor lists of a transposition_table instead of generating them lazily when both are
+        given). This keeps plans
+        optimal for breadth first search, and for A* because every step costs 1 and both
+        heuristics are consistent and at least 1 on every non goal state.
+
+        With a plan_cache (a plan_cache.PlanCache), a query whose initial state is stored is
+        answered from the cache, every returned plan is stored, and stored distances to the goal
+        replace the heuristic estimate for the states they cover. Those distances are exact, so
+        the heuristic stays admissible and the plans optimal.
+
+        With a transposition_table (a transposition.TranspositionTable for this problem's
+        goal_board and heuristic, which may be shared with other problems for the same goal and
+        heuristic), heuristic values and the successor lists of "heap_a_star", "a_star" and
+        "ida_star" are looked up in and stored to the table, and the exact distances along every
+        returned plan are recorded in it.
         """
-        self.search_alg_fnc = self.a_star_algorithm
+        if transposition_table is not None:
+            if transposition_table.goal != self.goal_board:
+                raise ValueError("The transposition table belongs to another goal")
+            heuristic_name = heuristic if heuristic in ("knight", "hamming") else "knight"
+            if transposition_table.heuristic_name != heuristic_name:
+                raise ValueError(f"The transposition table holds {transposition_table.heuristic_name!r} bounds, "
+                                 f"not {heuristic_name!r} ones")
+        self.early_goal_test = early_goal_test
+        self.plan_cache = plan_cache
+        self.transposition_table = transposition_table
+        self.successors_fnc = successors
+        heuristics = {
+            "": self.knight_heuristic,
+            "knight": self.knight_heuristic,
+            "hamming": self.hamming_heuristic,
+        }
+        self.heuristic_fnc = heuristics.get(heuristic, heuristics[""])
+        if transposition_table is not None:
+            self.estimate_fnc = self.heuristic_fnc
+            self.heuristic_fnc = self.table_heuristic
+            self.successors_fnc = transposition_table.successors
+        if plan_cache is not None:
+            self.base_heuristic_fnc = self.heuristic_fnc
+            self.heuristic_fnc = self.cached_heuristic
+
+        algorithms = {
+            "": self.heap_a_star_algorithm,
+            "heap_a_star": self.heap_a_star_algorithm,
+            "a_star": self.a_star_algorithm,
+            "bfs": self.breadth_first_algorithm,
+            "bidirectional": self.bidirectional_algorithm,
+            "ida_star": self.ida_star_algorithm,
+            "vector_bfs": self.vector_bfs_algorithm,
+            "hda_star": self.hda_star_algorithm,
+            "zobrist_a_star": self.zobrist_a_star_algorithm,
+            "lazy_bfs": self.lazy_bfs_algorithm,
+            "store_a_star": self.store_a_star_algorithm,
+            "external_bfs": self.external_bfs_algorithm,
+        }
+        self.search_alg_fnc = algorithms.get(alg, algorithms[""])
+        if plan_cache is not None or transposition_table is not None:
+            self.base_search_alg_fnc = self.search_alg_fnc
+            self.search_alg_fnc = self.cached_search
 
     def get_actions(self, state: tuple):
         """
@@ -79,11 +264,21 @@ class GameStateProblem(Problem):
             returns a set of actions
         """
         s, p = state
-        np_state = np.array(s)
-        self.sim.game_state.state = np_state
-        self.sim.game_state.decode_state = self.sim.game_state.make_state()
+        return generate_actions(s, p)
 
-        return self.sim.generate_valid_actions(p)
+    def successors(self, state: tuple):
+        """
+        Yields (action, next_state) for every action available in the given state
+
+        This does not touch any shared GameSimulator/BoardState, so it is safe to call from
+        several threads at once.
+
+        Inputs:
+            state: (encoded_state, player_idx), as in get_actions
+        """
+        s, p = state
+        for action in generate_actions(s, p):
+            yield action, self.execute(state, action)
 
     def execute(self, state: tuple, action: tuple):
         """
@@ -142,8 +337,7 @@ class GameStateProblem(Problem):
         if self.is_goal(self.initial_state):
             return [(self.initial_state, None)]
 
-        for action in self.get_actions(self.initial_state):
-            new_state = self.execute(self.initial_state, action)
+        for action, new_state in self.successors(self.initial_state):
             q.put((new_state, action, [(self.initial_state, action)]))
 
         while not q.empty():
@@ -153,42 +347,99 @@ class GameStateProblem(Problem):
                 path.append((state, None))
                 return path
             
-            for action in self.get_actions(state):
-                new_state = self.execute(state, action)
+            for action, new_state in self.successors(state):
                 new_path = list(path)
                 new_path.append((state, action))
                 q.put((new_state, action, new_path))
 
+        raise InfeasibleQuery()
+
     def create_hash(self, state: tuple):
-        board = ','.join(str(pos) for pos in state[0])
-        return board + ':' + str(state[1])
+        """
+        Returns the packed int key of a ((12-tuple), player_idx) state
+        """
+        return pack_state(state[0], state[1])
 
     def heuristic(self, state: tuple):
-        h = np.inf
+        return self.heuristic_fnc(self.create_hash(state))
 
-        for goal in self.goal_state_set:
-            count = 0
-            for i in range(len(goal[0])):
-                if state[0][i] != goal[0][i]:
-                    count += 1
+    def hamming_heuristic(self, key: int):
+        """
+        Number of board slots of the packed state key that differ from the goal. The goal set
+        contains the goal board with either player to move, so the player to move never adds
+        to the estimate.
+        """
+        return differing_slots(key, self.goal_board)
+
+    def knight_heuristic(self, key: int):
+        """
+        Admissible and consistent estimate of the number of plies from the packed state key to the goal
 
-            if state[1] != goal[1]:
+        Each player needs at least the sum of the knight distances of their block pieces to
+        their goal squares, plus one pass if their ball is not on its goal square. Players
+        alternate, so the player to move needs 2*m - 1 plies to make m moves and the other
+        player needs 2*m plies.
+        """
+        board = unpack_board(key)
+        goal = self.goal_positions
+        moves = [0, 0]
+        for player_idx, offset in ((0, 0), (1, 6)):
+            count = 0
+            for idx in range(offset, offset + 5):
+                count += KNIGHT_DISTANCE[board[idx] * N_SQUARES + goal[idx]]
+            if board[offset + 5] != goal[offset + 5]:
                 count += 1
+            moves[player_idx] = count
 
-            if count < h:
-                h = count
+        player_idx = key >> SIDE_SHIFT
+        return max(2 * moves[player_idx] - 1, 2 * moves[1 - player_idx], 0)
 
-        return h
+    def cached_heuristic(self, key: int):
+        """
+        Exact distance to the goal from the plan cache if the packed state key is stored there,
+        otherwise the estimate of the selected heuristic
+        """
+        distance = self.plan_cache.distance(self.goal_board, key)
+        if distance is None:
+            return self.base_heuristic_fnc(key)
+        return distance
 
-        
-    def reconstruct_path(self, came_from, state):
+    def table_heuristic(self, key: int):
+        """
+        Distance bound of the packed state key from the transposition table, computed with the
+        selected heuristic on a miss
+        """
+        return self.transposition_table.heuristic(key, self.estimate_fnc)
+
+    def cached_search(self):
+        """
+        Returns the plan stored in the plan cache for the initial state, or runs the selected
+        search algorithm and records the plan it returns in the plan cache and the
+        transposition table
+        """
+        init_key = self.create_hash(self.initial_state)
+        if self.plan_cache is not None:
+            path = self.plan_cache.plan(self.goal_board, init_key)
+            if path is not None:
+                return [(unpack_state(key), action) for key, action in path]
+
+        path = self.base_search_alg_fnc()
+        keyed_path = [(self.create_hash(state), action) for state, action in path]
+        if self.plan_cache is not None:
+            self.plan_cache.store(self.goal_board, keyed_path)
+        if self.transposition_table is not None:
+            self.transposition_table.store_plan([key for key, _ in keyed_path])
+        return path
+
+    def reconstruct_path(self, came_from, key):
+        """
+        Walks came_from back from the packed state key and returns the path in the public format
+        """
         total_path = []
-        total_path.append((state, None))
-        state_hash = self.create_hash(state)
-        while state_hash in came_from:
-            action, state = came_from[state_hash]
-            state_hash = self.create_hash(state)
-            total_path.append((state, action))
+        total_path.append((unpack_state(key), None))
+        while key in came_from:
+            action, key = came_from[key]
+            total_path.append((unpack_state(key), action))
         return list(reversed(total_path))
 
     def a_star_algorithm(self):
@@ -197,32 +448,420 @@ class GameStateProblem(Problem):
         came_from = {}
         g_score = {}
 
-        init_hash = self.create_hash(self.initial_state)
-        g_score[init_hash] = 0
-        init_heuristic = self.heuristic(self.initial_state)
-        min_queue.put((init_heuristic, self.initial_state))
-        queue_set.add(init_hash)
+        init_key = self.create_hash(self.initial_state)
+        g_score[init_key] = 0
+        init_heuristic = self.heuristic_fnc(init_key)
+        min_queue.put((init_heuristic, init_key))
+        queue_set.add(init_key)
 
         while not min_queue.empty():
-            _, state = min_queue.get()
-            state_hash = self.create_hash(state)
-            queue_set.remove(state_hash)
+            _, key = min_queue.get()
+            queue_set.remove(key)
 
-            if self.is_goal(state):
-                return self.reconstruct_path(came_from, state)
+            if key in self.goal_keys:
+                return self.reconstruct_path(came_from, key)
             
-            for action in self.get_actions(state):
-                new_state = self.execute(state, action)
-                new_state_hash = self.create_hash(new_state)
+            for action, new_key in self.successors_fnc(key):
+                tentative_g_score = g_score[key] + 1
+                if new_key not in g_score or tentative_g_score < g_score[new_key]:
+                    came_from[new_key] = (action, key)
+                    g_score[new_key] = tentative_g_score
+                    new_score = tentative_g_score + self.heuristic_fnc(new_key)
+                    if new_key not in queue_set:
+                        min_queue.put((new_score, new_key))
+                        queue_set.add(new_key)
+
+
+        raise InfeasibleQuery()
+
+    def heap_a_star_algorithm(self):
+        """
+        A* over packed states on a heapq open list
 
-                tentative_g_score = g_score[state_hash] + 1
-                if new_state_hash not in g_score or tentative_g_score < g_score[new_state_hash]:
-                    came_from[new_state_hash] = (action, state)
-                    g_score[new_state_hash] = tentative_g_score
-                    new_score = tentative_g_score + self.heuristic(new_state)
-                    if new_state_hash not in queue_set:
-                        min_queue.put((new_score, new_state))
-                        queue_set.add(new_state_hash)
+        Entries are (f, -g, insertion counter, key), so ties on f go to the deeper node and then to
+        the older entry, and states are never compared. When a cheaper path to a state is found a
+        new entry is pushed and the old one is skipped when popped (lazy deletion). Expanded states
+        are kept in a closed set and only reopened if a strictly cheaper path to them turns up.
+        """
+        init_key = self.create_hash(self.initial_state)
+        early_goal_test = self.early_goal_test
+        ## Stored successor lists are already generated, so the table wins over lazy generation
+        lazy = early_goal_test and self.transposition_table is None
+        successor_fnc = iter_successors if lazy else self.successors_fnc
+        counter = itertools.count()
+        open_heap = [(self.heuristic_fnc(init_key), 0, next(counter), init_key)]
+        g_score = {init_key: 0}
+        came_from = {}
+        closed = set()
+
+        while open_heap:
+            _, neg_g, _, key = heapq.heappop(open_heap)
+            if key in closed or -neg_g != g_score[key]:
+                continue
+
+            if key in self.goal_keys:
+                return self.reconstruct_path(came_from, key)
+            closed.add(key)
+
+            tentative_g_score = 1 - neg_g
+            for action, new_key in successor_fnc(key):
+                old_g_score = g_score.get(new_key)
+                if old_g_score is not None and tentative_g_score >= old_g_score:
+                    continue
+
+                g_score[new_key] = tentative_g_score
+                came_from[new_key] = (action, key)
+                if early_goal_test and new_key in self.goal_keys:
+                    return self.reconstruct_path(came_from, new_key)
+                closed.discard(new_key)
+                new_score = tentative_g_score + self.heuristic_fnc(new_key)
+                heapq.heappush(open_heap, (new_score, -tentative_g_score, next(counter), new_key))
+
+        raise InfeasibleQuery()
+
+    def bidirectional_algorithm(self):
+        """
+        Front-to-front bidirectional breadth first search over packed states
 
+        The forward search expands successors of the initial state and the backward search expands
+        predecessors of both goal states, one whole layer at a time, always growing the smaller
+        frontier. Every newly reached state is checked against the other side. Once a layer produces
+        a meeting state, the layer is finished and the meeting state with the shortest total
+        distance is used, which gives an optimal plan.
+        """
+        init_key = self.create_hash(self.initial_state)
+        if init_key in self.goal_keys:
+            return [(self.initial_state, None)]
 
-        return "ERROR"
+        came_from = {}
+        forward_depth = 0
+        forward_frontier = [init_key]
+        goes_to = {key: None for key in self.goal_keys}
+        backward_depth = {key: 0 for key in self.goal_keys}
+        backward_frontier = list(self.goal_keys)
+
+        while forward_frontier and backward_frontier:
+            best = None
+            if len(forward_frontier) <= len(backward_frontier):
+                forward_depth += 1
+                next_frontier = []
+                for key in forward_frontier:
+                    for action, new_key in successors(key):
+                        if new_key in came_from or new_key == init_key:
+                            continue
+                        came_from[new_key] = (action, key)
+                        next_frontier.append(new_key)
+                        if new_key in goes_to:
+                            length = forward_depth + backward_depth[new_key]
+                            if best is None or length < best[0]:
+                                best = (length, new_key)
+                forward_frontier = next_frontier
+            else:
+                next_frontier = []
+                for key in backward_frontier:
+                    depth = backward_depth[key] + 1
+                    for action, new_key in predecessors(key):
+                        if new_key in goes_to:
+                            continue
+                        goes_to[new_key] = (action, key)
+                        backward_depth[new_key] = depth
+                        next_frontier.append(new_key)
+                        if new_key in came_from or new_key == init_key:
+                            length = forward_depth + depth
+                            if best is None or length < best[0]:
+                                best = (length, new_key)
+                backward_frontier = next_frontier
+
+            if best is not None:
+                meet_key = best[1]
+                path = self.reconstruct_path(came_from, meet_key)[:-1]
+                key = meet_key
+                while goes_to[key] is not None:
+                    action, next_key = goes_to[key]
+                    path.append((unpack_state(key), action))
+                    key = next_key
+                path.append((unpack_state(key), None))
+                return path
+
+        raise InfeasibleQuery()
+
+    def ida_star_algorithm(self, table_size=1 << 16):
+        """
+        Iterative deepening A* over packed states
+
+        Runs depth first searches bounded by f = g + h, raising the bound to the smallest f that
+        exceeded it until a goal is found. Only the current path is kept, plus a transposition
+        table of at most table_size entries holding the smallest g each state was reached with
+        during the current iteration; a state reached again with no smaller g is skipped.
+        """
+        init_key = self.create_hash(self.initial_state)
+        heuristic = self.heuristic_fnc
+        path_keys = [init_key]
+        path_actions = []
+        on_path = set(path_keys)
+        table = {}
+
+        def bounded_search(key, g, bound):
+            f = g + heuristic(key)
+            if f > bound:
+                return f
+            if key in self.goal_keys:
+                return None
+
+            minimum = np.inf
+            new_g = g + 1
+            for action, new_key in self.successors_fnc(key):
+                if new_key in on_path:
+                    continue
+                seen_g = table.get(new_key)
+                if seen_g is not None and seen_g <= new_g:
+                    continue
+                if seen_g is not None or len(table) < table_size:
+                    table[new_key] = new_g
+
+                path_keys.append(new_key)
+                path_actions.append(action)
+                on_path.add(new_key)
+                t = bounded_search(new_key, new_g, bound)
+                if t is None:
+                    return None
+                if t < minimum:
+                    minimum = t
+                path_keys.pop()
+                path_actions.pop()
+                on_path.remove(new_key)
+            return minimum
+
+        bound = heuristic(init_key)
+        while bound != np.inf:
+            table.clear()
+            bound = bounded_search(init_key, 0, bound)
+            if bound is None:
+                path = [(unpack_state(key), action) for key, action in zip(path_keys, path_actions)]
+                path.append((unpack_state(path_keys[-1]), None))
+                return path
+
+        raise InfeasibleQuery()
+
+    def vector_bfs_algorithm(self, memory_budget=DEFAULT_MEMORY_BUDGET):
+        """
+        Level synchronous breadth first search with every frontier held in NumPy arrays
+
+        The player to move is fixed by the depth, so states are keyed by their packed board alone,
+        and a frontier is kept as its sorted keys. Each layer is unpacked and expanded with
+        generate_actions_batch in chunks small enough for memory_budget. The children of a chunk
+        are deduplicated with np.unique and filtered against the sorted keys of the earlier layers
+        with the same player to move, and the survivors of all chunks are merged with one more
+        np.unique. Every layer stores, per state, the index of its parent in the previous layer
+        and the action packed as relative_idx * 64 + position; the plan is rebuilt from those at
+        the end.
+        """
+        first_player = self.initial_state[1]
+        frontier_keys = words_as_keys(pack_states_array(np.array([self.initial_state[0]], dtype=np.int64)))
+        goal_key = words_as_keys(pack_states_array(self.goal_positions))[0]
+        chunk_size = max(1, memory_budget // BYTES_PER_EXPANSION)
+        visited = ([], [])
+        visited[first_player].append(frontier_keys)
+        layers = []
+
+        while len(frontier_keys):
+            found = np.flatnonzero(frontier_keys == goal_key)
+            if len(found):
+                return self._replay_layers(layers, int(found[0]))
+
+            player_idx = (first_player + len(layers)) % 2
+            seen_layers = visited[1 - player_idx]
+            frontier_words = frontier_keys.view(np.int64).reshape(-1, 2)
+            chunk_keys, chunk_parents, chunk_actions = [], [], []
+            for start in range(0, len(frontier_words), chunk_size):
+                boards, _ = unpack_states_array(frontier_words[start:start + chunk_size])
+                offsets, relative_idx, positions, children = generate_actions_batch(boards, np.full(len(boards), player_idx))
+                keys, first = np.unique(words_as_keys(pack_states_array(children)), return_index=True)
+                keep = np.ones(len(keys), dtype=bool)
+                for seen in seen_layers:
+                    if not len(seen):
+                        continue
+                    idx = np.minimum(np.searchsorted(seen, keys), len(seen) - 1)
+                    keep &= seen[idx] != keys
+                keys, first = keys[keep], first[keep]
+                parents = np.searchsorted(offsets, first, side="right") - 1 + start
+                chunk_keys.append(keys)
+                chunk_parents.append(parents)
+                chunk_actions.append((relative_idx[first] << 6 | positions[first]).astype(np.uint16))
+
+            keys, first = np.unique(np.concatenate(chunk_keys), return_index=True)
+            seen_layers.append(keys)
+            layers.append((np.concatenate(chunk_parents)[first], np.concatenate(chunk_actions)[first]))
+            frontier_keys = keys
+
+        raise InfeasibleQuery()
+
+    def _replay_layers(self, layers, idx):
+        """
+        Follows parent indices back from state idx of the last layer and replays the actions
+        from the initial state
+        """
+        actions = []
+        for parents, packed_actions in reversed(layers):
+            action = int(packed_actions[idx])
+            actions.append((action >> 6, action & 63))
+            idx = parents[idx]
+
+        path = []
+        state = unpack_state(self.create_hash(self.initial_state))
+        for action in reversed(actions):
+            path.append((state, action))
+            state = self.execute(state, action)
+        path.append((state, None))
+        return path
+
+    def hda_star_algorithm(self, n_workers=None, round_size=DEFAULT_ROUND_SIZE):
+        """
+        Hash distributed A* across n_workers processes (default: one per CPU), see parallel_search
+        """
+        path = hda_star(self, n_workers, round_size)
+        if path is None:
+            raise InfeasibleQuery()
+        return path
+
+    def zobrist_a_star_algorithm(self):
+        """
+        heap_a_star_algorithm with its tables in a ZobristTable
+
+        Child keys are derived from the parent key with a few XORs by zobrist_successors. Each
+        table value is [g, action, parent packed state, parent Zobrist key, closed].
+        """
+        init_key = self.create_hash(self.initial_state)
+        init_zobrist = zobrist_key(self.initial_state[0], self.initial_state[1])
+        counter = itertools.count()
+        open_heap = [(self.heuristic_fnc(init_key), 0, next(counter), init_key, init_zobrist)]
+        nodes = ZobristTable()
+        nodes.put(init_zobrist, init_key, [0, None, None, None, False])
+
+        while open_heap:
+            _, neg_g, _, key, zobrist = heapq.heappop(open_heap)
+            node = nodes.get(zobrist, key)
+            if node[4] or -neg_g != node[0]:
+                continue
+
+            if key in self.goal_keys:
+                path = [(unpack_state(key), None)]
+                while node[2] is not None:
+                    action, key, zobrist = node[1], node[2], node[3]
+                    path.append((unpack_state(key), action))
+                    node = nodes.get(zobrist, key)
+                return list(reversed(path))
+            node[4] = True
+
+            tentative_g_score = 1 - neg_g
+            for action, new_key, new_zobrist in zobrist_successors(key, zobrist):
+                new_node = nodes.get(new_zobrist, new_key)
+                if new_node is not None and tentative_g_score >= new_node[0]:
+                    continue
+
+                nodes.put(new_zobrist, new_key, [tentative_g_score, action, key, zobrist, False])
+                new_score = tentative_g_score + self.heuristic_fnc(new_key)
+                heapq.heappush(open_heap, (new_score, -tentative_g_score, next(counter), new_key, new_zobrist))
+
+        raise InfeasibleQuery()
+
+    def lazy_bfs_algorithm(self):
+        """
+        Breadth first search over packed states with a visited set, expanding each state through
+        the lazy successor generator. With early_goal_test the goal is checked as children are
+        generated, so the search stops partway through the layer that contains the goal.
+        """
+        init_key = self.create_hash(self.initial_state)
+        if init_key in self.goal_keys:
+            return [(self.initial_state, None)]
+
+        early_goal_test = self.early_goal_test
+        came_from = {}
+        q = collections.deque([init_key])
+
+        while q:
+            key = q.popleft()
+            if key in self.goal_keys:
+                return self.reconstruct_path(came_from, key)
+
+            for action, new_key in iter_successors(key):
+                if new_key in came_from or new_key == init_key:
+                    continue
+                came_from[new_key] = (action, key)
+                if early_goal_test and new_key in self.goal_keys:
+                    return self.reconstruct_path(came_from, new_key)
+                q.append(new_key)
+
+        raise InfeasibleQuery()
+
+    def store_a_star_algorithm(self):
+        """
+        heap_a_star_algorithm with g values, parents and actions kept in a NodeStore
+
+        The open list is bucketed: open_lists[f][g] is an array("I") of node ids, so an open
+        entry costs 4 bytes. Nodes are popped from the smallest f, and within it from the largest
+        g, which orders them like the (f, -g) heap entries of heap_a_star_algorithm; each bucket is
+        a stack. Entries whose g is stale are skipped when popped, and a bytearray marks the
+        closed nodes. The plan is rebuilt from the parent column.
+        """
+        nodes = NodeStore()
+        init_key = self.create_hash(self.initial_state)
+        nodes.add(init_key, -1, 0, 0)
+        closed = bytearray(1)
+        f = self.heuristic_fnc(init_key)
+        open_lists = [[] for _ in range(f)] + [[array("I", [0])]]
+
+        while f < len(open_lists):
+            g_lists = open_lists[f]
+            while g_lists and not g_lists[-1]:
+                g_lists.pop()
+            if not g_lists:
+                f += 1
+                continue
+            g = len(g_lists) - 1
+            node = g_lists[g].pop()
+            if closed[node] or g != nodes.g[node]:
+                continue
+
+            key = nodes.key(node)
+            if key in self.goal_keys:
+                return [(unpack_state(key), action) for key, action in nodes.path(node)]
+            closed[node] = 1
+
+            tentative_g_score = g + 1
+            for action, new_key in successors(key):
+                new_node = nodes.find(new_key)
+                if new_node < 0:
+                    new_node = nodes.add(new_key, node, pack_action(action), tentative_g_score)
+                    closed.append(0)
+                elif tentative_g_score < nodes.g[new_node]:
+                    nodes.parent[new_node] = node
+                    nodes.action[new_node] = pack_action(action)
+                    nodes.g[new_node] = tentative_g_score
+                    closed[new_node] = 0
+                else:
+                    continue
+
+                new_score = tentative_g_score + self.heuristic_fnc(new_key)
+                while len(open_lists) <= new_score:
+                    open_lists.append([])
+                new_g_lists = open_lists[new_score]
+                while len(new_g_lists) <= tentative_g_score:
+                    new_g_lists.append(array("I"))
+                new_g_lists[tentative_g_score].append(new_node)
+                f = min(f, new_score)
+
+        raise InfeasibleQuery()
+
+    def external_bfs_algorithm(self, scratch_dir=None, memory_budget=DEFAULT_MEMORY_BUDGET,
+                               n_buckets=DEFAULT_BUCKETS):
+        """
+        Disk backed breadth first search, see external_search. Layer files go to a private
+        directory under scratch_dir (default: the system temp directory) on local disk,
+        memory_budget bounds the chunks that are expanded and deduplicated at once, and
+        n_buckets sets the number of hash buckets per layer.
+        """
+        path = external_bfs(self, scratch_dir, memory_budget, n_buckets)
+        if path is None:
+            raise InfeasibleQuery()
+        return path
@@ -0,0 +1,255 @@
+"""
+Retrograde endgame tablebases for restricted classes of positions.
+
+A class is given by a base board and a set of free slots. The positions of the class are all
+boards that agree with the base board outside the free slots, with either player to move, and
+the game played in it is the one where only the free pieces move. A player with no free piece
+passes instead. The full game has 56^12 boards, so only such restricted games can be solved.
+The distances are exact for the restricted game. They carry over to the full game where moving
+the frozen pieces can not change the outcome, so the free slots should cover the pieces that
+matter near the end: a ball, the blocks that can receive it and the opposing blocks that can
+cut its lanes.
+
+Every position has a perfect index: the side to move times 56^k plus the positions of the k
+free slots as base 56 digits. The table is an int16 .npy file opened with np.memmap, with one
+value per index: the number of plies to the end of the game under optimal play, where the
+winner hurries and the loser delays, or UNKNOWN for positions that are not decided. An even
+value means the player to move loses (0 is a termination state, where the player who moved
+last has won), an odd value means the player to move wins.
+
+The table is built backwards from the termination states, one ply at a time. Positions with
+value n-1 are expanded with predecessor generation: for odd n every undecided predecessor is
+a win in n, for even n an undecided predecessor is a loss in n once all of its successors are
+wins for the opponent. The frontier of each level is split over a process pool. The level
+reached is recorded in a .json file next to the table after every level, so an interrupted
+build resumes where it stopped.
+"""
+
+import json
+import multiprocessing as mp
+import os
+
+import numpy as np
+
+from bitboard import N_SQUARES, SIDE_BIT, SIDE_SHIFT, SLOT_BITS, SLOT_MASK, pack_state, predecessors, successors
+from bitboard import termination_batch
+
+UNKNOWN = -1
+
+_MAX_LEVEL = np.iinfo(np.int16).max
+_INIT_CHUNK = 1 << 16
+
+
+class Tablebase:
+    """
+    Memory-mapped tablebase for the positions of base_board in which free_slots move
+
+    Inputs:
+        - path, the .npy table file; its metadata is stored in path + ".json"
+        - base_board, 12 on-board encoded positions laid out like BoardState.state
+        - free_slots, the slots (0-11) whose pieces move
+        - mode, "r+" to build or extend the table, "r" to only probe it
+
+    An existing table is reopened if its metadata matches the class, and a ValueError is raised
+    if it belongs to another class.
+    """
+
+    def __init__(self, path, base_board, free_slots, mode="r+"):
+        base_board = [int(pos) for pos in base_board]
+        free_slots = tuple(sorted(set(int(slot) for slot in free_slots)))
+        if len(base_board) != 12 or not all(0 <= pos < N_SQUARES for pos in base_board):
+            raise ValueError("base_board must hold 12 on-board positions")
+        if not free_slots or not all(0 <= slot < 12 for slot in free_slots):
+            raise ValueError("free_slots must be a non empty set of slots in [0, 11]")
+
+        self.path = path
+        self.base_board = base_board
+        self.free_slots = free_slots
+        self.n_boards = N_SQUARES ** len(free_slots)
+        self.size = 2 * self.n_boards
+        self.passes = [not any(player_idx * 6 <= slot < player_idx * 6 + 6 for slot in free_slots)
+                       for player_idx in (0, 1)]
+
+        self._digits = [(slot * SLOT_BITS, N_SQUARES ** j) for j, slot in enumerate(free_slots)]
+        self._fixed_mask = sum(SLOT_MASK << slot * SLOT_BITS for slot in range(12) if slot not in free_slots)
+        self._fixed = pack_state(base_board, 0) & self._fixed_mask
+
+        self.level = None
+        self.complete = False
+        self.values = None
+        if os.path.exists(path):
+            with open(path + ".json") as f:
+                metadata = json.load(f)
+            if metadata["base_board"] != base_board or tuple(metadata["free_slots"]) != free_slots:
+                raise ValueError(f"{path} holds a tablebase for another class of positions")
+            self.level = metadata["level"]
+            self.complete = metadata["complete"]
+            self.values = np.load(path, mmap_mode=mode)
+
+    def index(self, packed: int):
+        """
+        Returns the index of the packed state, or -1 if it is not in the class
+        """
+        if packed & self._fixed_mask != self._fixed:
+            return -1
+        idx = (packed >> SIDE_SHIFT) * self.n_boards
+        for shift, weight in self._digits:
+            idx += (packed >> shift & SLOT_MASK) * weight
+        return idx
+
+    def packed(self, idx: int):
+        """
+        Returns the packed state of an index
+        """
+        packed = self._fixed | (idx // self.n_boards) << SIDE_SHIFT
+        for shift, weight in self._digits:
+            packed |= (idx // weight % N_SQUARES) << shift
+        return packed
+
+    def boards(self, indices):
+        """
+        Returns the (N, 12) encoded boards of an array of indices
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        boards = np.tile(np.array(self.base_board, dtype=np.int64), (len(indices), 1))
+        for slot, (_, weight) in zip(self.free_slots, self._digits):
+            boards[:, slot] = indices // weight % N_SQUARES
+        return boards
+
+    def probe(self, board, player_idx: int):
+        """
+        Returns the stored number of plies to the end of the game for the encoded board with
+        player_idx to move (odd: player_idx wins, even: player_idx loses), or None if the
+        position is not in the class or not decided
+        """
+        return self.probe_packed(pack_state(board, player_idx))
+
+    def probe_packed(self, packed: int):
+        idx = self.index(packed)
+        if idx < 0 or self.values is None:
+            return None
+        value = int(self.values[idx])
+        return None if value == UNKNOWN else value
+
+    def _save_metadata(self):
+        metadata = {"base_board": self.base_board, "free_slots": list(self.free_slots),
+                    "level": self.level, "complete": self.complete}
+        with open(self.path + ".json.tmp", "w") as f:
+            json.dump(metadata, f)
+        os.replace(self.path + ".json.tmp", self.path + ".json")
+
+    def build(self, n_workers=None, max_level=None, chunk_size=4096):
+        """
+        Builds the table, or resumes an interrupted build
+
+        Inputs:
+            - n_workers, the number of worker processes (default: one per CPU); 1 runs in
+              this process
+            - max_level, stop after this level even if the table is not complete (None for no
+              limit); the build can be resumed later
+            - chunk_size, the number of frontier positions handed to a worker at a time
+        """
+        if self.values is None:
+            self.values = np.lib.format.open_memmap(self.path, mode="w+", dtype=np.int16, shape=(self.size,))
+            self.values[:] = UNKNOWN
+            self.level = -1
+            self._save_metadata()
+
+        if self.level < 0:
+            for start in range(0, self.size, _INIT_CHUNK):
+                indices = np.arange(start, min(start + _INIT_CHUNK, self.size))
+                self.values[indices[termination_batch(self.boards(indices))]] = 0
+            self.values.flush()
+            self.level = 0
+            self._save_metadata()
+
+        n_workers = n_workers or os.cpu_count() or 1
+        pool = mp.Pool(n_workers) if n_workers > 1 else None
+        try:
+            while not self.complete and (max_level is None or self.level < max_level):
+                level = self.level + 1
+                if level > _MAX_LEVEL:
+                    raise OverflowError("The tablebase needs more levels than int16 values can hold")
+                frontier = np.flatnonzero(self.values == level - 1)
+                chunks = [frontier[start:start + chunk_size] for start in range(0, len(frontier), chunk_size)]
+                if pool is None:
+                    found = [self.expand(chunk, level) for chunk in chunks]
+                else:
+                    jobs = [(self.path, self.base_board, self.free_slots, chunk, level) for chunk in chunks]
+                    found = pool.map(_expand_chunk, jobs)
+                found = np.unique(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+
+                self.values[found] = level
+                self.values.flush()
+                self.level = level
+                ## Read back from the table: a level redone after a crash finds nothing new
+                self.complete = not (self.values == level).any()
+                self._save_metadata()
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def parents(self, packed: int):
+        """
+        Yields the packed states the class game reaches packed from
+        """
+        if self.passes[1 - (packed >> SIDE_SHIFT)]:
+            yield packed ^ SIDE_BIT
+            return
+        for _, parent in predecessors(packed):
+            yield parent
+
+    def children(self, packed: int):
+        """
+        Yields the packed states the class game moves to from packed
+        """
+        if self.passes[packed >> SIDE_SHIFT]:
+            yield packed ^ SIDE_BIT
+            return
+        for _, child in successors(packed):
+            yield child
+
+    def _all_children_win(self, packed: int):
+        """
+        Returns whether every move of the class game from packed leads to a decided win for
+        the opponent
+        """
+        for child in self.children(packed):
+            idx = self.index(child)
+            if idx < 0:
+                continue
+            value = self.values[idx]
+            if value == UNKNOWN or value % 2 == 0:
+                return False
+        return True
+
+    def expand(self, indices, level: int):
+        """
+        Returns the sorted indices of the undecided predecessors of the positions at indices
+        (all of value level - 1) that have value level
+        """
+        values = self.values
+        wins = level % 2 == 1
+        found = set()
+        for idx in indices:
+            for parent in self.parents(self.packed(int(idx))):
+                parent_idx = self.index(parent)
+                if parent_idx < 0 or parent_idx in found or values[parent_idx] != UNKNOWN:
+                    continue
+                if wins or self._all_children_win(parent):
+                    found.add(parent_idx)
+        return np.array(sorted(found), dtype=np.int64)
+
+
+## Tablebases opened read-only by each pool worker, by path
+_worker_tables = {}
+
+
+def _expand_chunk(job):
+    path, base_board, free_slots, indices, level = job
+    table = _worker_tables.get(path)
+    if table is None:
+        table = Tablebase(path, base_board, free_slots, mode="r")
+        _worker_tables[path] = table
+    return table.expand(indices, level)
@@ -1,8 +1,17 @@
 import numpy as np
 import queue
+import time
 import pytest
-from game import BoardState, GameSimulator, Rules
-from search import GameStateProblem
+from game import BoardState, GameSimulator, MoveLog, Rules, run_headless_games
+from search import GameStateProblem, InfeasibleQuery, ZobristTable
+from parallel_search import solve_many
+from node_store import NodeStore
+from plan_cache import PlanCache
+from players import _TABLEBASE_SCORE, WIN, AlphaBetaPlayer, MCTSPlayer, RandomPlayer, random_playouts
+from tournament import WINNERS, Tournament, load_shards, register_player
+from tablebase import Tablebase
+from transposition import TableEntry, TranspositionTable
+from bitboard import pack_state, unpack_state, apply_action, predecessors, successors, zobrist_key, zobrist_successors, iter_successors, termination_batch
 
 class TestSearch:
 
@@ -18,7 +27,7 @@ class TestSearch:
     ## NOTE: If you'd like to test multiple variants of your algorithms, enter their keys below
     ## in the parametrize function. Your set_search_alg should then set the correct method to
     ## use.
-    @pytest.mark.parametrize("alg", ["", ""])
+    @pytest.mark.parametrize("alg", ["", "heap_a_star", "a_star", "bidirectional", "ida_star", "vector_bfs", "hda_star", "zobrist_a_star", "lazy_bfs", "store_a_star", "external_bfs"])
     def test_game_state_problem(self, alg):
         """
         Tests search based planning
@@ -53,6 +62,561 @@ class TestSearch:
         assert sln[2][1] == (0, 23)
         assert sln[4] == (tuple((tuple(b2.state), 0)), None)
 
+    def test_packed_state(self):
+        b1 = BoardState()
+        key = pack_state(b1.state, 1)
+        assert unpack_state(key) == (tuple(b1.state), 1)
+        assert unpack_state(pack_state([55] * 12, 0)) == ((55,) * 12, 0)
+
+        gsp = GameStateProblem(b1, b1, 0)
+        state = gsp.initial_state
+        for action in [(0, 14), (5, 51), (5, 4)]:
+            key = apply_action(gsp.create_hash(state), action)
+            state = gsp.execute(state, action)
+            assert unpack_state(key) == state
+
+    def test_successors(self):
+        b1 = BoardState()
+        gsp = GameStateProblem(b1, b1, 1)
+        state = gsp.initial_state
+
+        expected = [(action, gsp.execute(state, action)) for action in gsp.get_actions(state)]
+        assert list(gsp.successors(state)) == expected
+        assert [(a, unpack_state(k)) for a, k in successors(gsp.create_hash(state))] == expected
+
+    @pytest.mark.parametrize("heuristic", ["hamming", "knight"])
+    def test_heuristic_plans(self, heuristic):
+        b1 = BoardState()
+        b2 = BoardState()
+        b2.update(0, 23)
+        b2.update(1, 11)
+        b2.update(6, 37)
+
+        gsp = GameStateProblem(b1, b2, 0)
+        gsp.set_search_alg("heap_a_star", heuristic)
+        sln = gsp.search_alg_fnc()
+
+        assert len(sln) == 7
+        assert sln[-1] == (tuple((tuple(b2.state), 0)), None)
+        for i, (state, action) in enumerate(sln):
+            assert gsp.heuristic(state) <= len(sln) - 1 - i
+
+    def test_knight_heuristic(self):
+        b1 = BoardState()
+        b2 = BoardState()
+        b2.update(0, 23)
+
+        gsp = GameStateProblem(b1, b2, 0)
+        gsp.set_search_alg("heap_a_star", "knight")
+        ## White needs two knight moves (3 plies), black would need none
+        assert gsp.heuristic(gsp.initial_state) == 3
+        assert gsp.heuristic((gsp.initial_state[0], 1)) == 4
+        assert gsp.heuristic((tuple(b2.state), 1)) == 0
+
+    def test_predecessors(self):
+        b1 = BoardState()
+        b1.update(2, 17)
+        key = pack_state(b1.state, 1)
+
+        for action, child in successors(key):
+            assert (action, key) in set(predecessors(child))
+            for pred_action, parent in predecessors(child):
+                assert (pred_action, child) in set(successors(parent))
+
+    def test_hda_star_workers(self):
+        b1 = BoardState()
+        b2 = BoardState()
+        b2.update(0, 23)
+        b2.update(6, 37)
+
+        gsp = GameStateProblem(b1, b2, 0)
+        sln = gsp.hda_star_algorithm(n_workers=3)
+
+        assert len(sln) == 4
+        assert sln[-1] == (tuple((tuple(b2.state), 1)), None)
+        for (state, action), (next_state, _) in zip(sln, sln[1:]):
+            assert gsp.execute(state, action) == next_state
+        assert len(gsp.expansions) == 3
+
+        ## Goals are caught as they are generated, so extra workers add few expansions
+        for idx, pos in [(1, 11), (2, 17), (7, 39)]:
+            b2.update(idx, pos)
+        gsp = GameStateProblem(b1, b2, 0)
+        sln = gsp.hda_star_algorithm(n_workers=1)
+        assert gsp.expansions == [len(sln) - 1]
+        assert len(gsp.hda_star_algorithm(n_workers=2)) == len(sln)
+        assert sum(gsp.expansions) < 2 * (len(sln) - 1)
+
+    def test_solve_many(self):
+        b1 = BoardState()
+        goals = []
+        for idx, pos in [(0, 14), (0, 23), (6, 37)]:
+            b2 = BoardState()
+            b2.update(idx, pos)
+            goals.append(b2)
+
+        queries = [(b1, b2, 0) for b2 in goals]
+        results = dict(solve_many(queries, n_workers=2))
+
+        assert sorted(results) == [0, 1, 2]
+        for idx, (b1, b2, player_idx) in enumerate(queries):
+            assert results[idx] == GameStateProblem(b1, b2, player_idx).search_alg_fnc()
+
+    def test_infeasible_query(self):
+        b1 = BoardState()
+        for idx, pos in [(0, -1), (5, 56), (11, 70)]:
+            b2 = BoardState()
+            state = b2.state.copy()
+            state[idx] = pos
+            b2.state = state
+            with pytest.raises(InfeasibleQuery) as exinfo:
+                GameStateProblem(b1, b2, 0)
+            assert len(exinfo.value.reasons) == 1
+            assert "off the board" in str(exinfo.value)
+
+        with pytest.raises(InfeasibleQuery) as exinfo:
+            GameStateProblem(b1, BoardState(), 2)
+        assert "player_idx" in exinfo.value.reasons[0]
+
+        b2 = BoardState()
+        b2.state = np.array([1,2,3,-5,5,3,50,51,52,53,54,52])
+        results = dict(solve_many([(b1, b2, 0), (b1, BoardState(), 0)], n_workers=2))
+        assert isinstance(results[0], InfeasibleQuery)
+        assert results[1] == [(tuple((tuple(b1.state), 0)), None)]
+
+    def test_plan_cache(self, tmp_path):
+        b1 = BoardState()
+        b2 = BoardState()
+        b2.update(0, 23)
+        b2.update(6, 37)
+        cache = PlanCache(str(tmp_path / "plans.sqlite"))
+
+        gsp = GameStateProblem(b1, b2, 0)
+        init_key = gsp.create_hash(gsp.initial_state)
+        assert cache.distance(gsp.goal_board, init_key) is None
+        assert not cache._distances
+        gsp.set_search_alg(plan_cache=cache)
+        sln = gsp.search_alg_fnc()
+        assert len(cache) == len(sln)
+        assert gsp.search_alg_fnc() == sln
+        assert cache.distance(gsp.goal_board, init_key) == len(sln) - 1
+        assert len(cache._distances) <= cache.lru_size
+
+        ## Every suffix of the plan is answered from the cache after reopening it
+        cache.close()
+        cache = PlanCache(str(tmp_path / "plans.sqlite"))
+        assert cache.distance(gsp.goal_board, init_key) == len(sln) - 1
+        for i, ((state, player_idx), action) in enumerate(sln):
+            b = BoardState()
+            b.state = np.array(state)
+            gsp = GameStateProblem(b, b2, player_idx)
+            gsp.set_search_alg(plan_cache=cache)
+            gsp.base_search_alg_fnc = None
+            assert gsp.search_alg_fnc() == sln[i:]
+
+        ## Nearby starts still get optimal plans with cached distances as heuristic values
+        b3 = BoardState()
+        b3.update(1, 17)
+        for alg in ["heap_a_star", "ida_star", "bfs"]:
+            gsp = GameStateProblem(b3, b2, 0)
+            gsp.set_search_alg(alg, plan_cache=cache)
+            expected = GameStateProblem(b3, b2, 0).search_alg_fnc()
+            assert len(gsp.search_alg_fnc()) == len(expected)
+        assert cache.lookup(gsp.goal_board, gsp.create_hash(gsp.initial_state))[0] == len(expected) - 1
+
+    @pytest.mark.parametrize("policy", ["lru", "depth"])
+    def test_transposition_table(self, policy):
+        b2 = BoardState()
+        b2.update(0, 23)
+        b2.update(6, 37)
+        starts = []
+        for idx, pos in [(1, 17), (2, 16), (1, 17)]:
+            b1 = BoardState()
+            b1.update(idx, pos)
+            starts.append(b1)
+
+        table = TranspositionTable(GameStateProblem(starts[0], b2, 0).goal_board, capacity=500, policy=policy)
+        for alg in ["heap_a_star", "ida_star"]:
+            for b1 in starts:
+                gsp = GameStateProblem(b1, b2, 0)
+                gsp.set_search_alg(alg, transposition_table=table)
+                expected = GameStateProblem(b1, b2, 0).search_alg_fnc()
+                assert len(gsp.search_alg_fnc()) == len(expected)
+                assert len(table) <= 500
+
+        assert table.hits > 0 and table.misses > 0
+        key = gsp.create_hash(gsp.initial_state)
+        if table.get(key) is not None:
+            assert table.get(key).h == len(expected) - 1
+
+        with pytest.raises(ValueError):
+            GameStateProblem(starts[0], starts[1], 0).set_search_alg(transposition_table=table)
+        with pytest.raises(ValueError):
+            GameStateProblem(starts[0], b2, 0).set_search_alg(heuristic="hamming", transposition_table=table)
+        hamming_table = TranspositionTable(table.goal, policy=policy, heuristic="hamming")
+        gsp = GameStateProblem(starts[0], b2, 0)
+        gsp.set_search_alg(heuristic="hamming", transposition_table=hamming_table)
+        assert len(gsp.search_alg_fnc()) == len(expected)
+
+        ## The early goal test takes its successor lists from the table too
+        gsp = GameStateProblem(starts[1], b2, 0)
+        table = TranspositionTable(gsp.goal_board, policy=policy)
+        gsp.set_search_alg("heap_a_star", early_goal_test=True, transposition_table=table)
+        assert len(gsp.search_alg_fnc()) == len(GameStateProblem(starts[1], b2, 0).search_alg_fnc())
+        assert table.get(gsp.create_hash(gsp.initial_state)).successors is not None
+
+    def test_transposition_exact_entries(self):
+        table = TranspositionTable(0, capacity=1, policy="depth")
+        table.store_plan([1, 0])
+        estimate = TableEntry()
+        estimate.h = 10
+        table.put(2, estimate)
+        assert table.get(1).exact and table.get(1).h == 1
+        assert table.get(2) is None
+
+        exact = TableEntry()
+        exact.h = 3
+        exact.exact = True
+        table.put(2, exact)
+        assert table.get(2) is exact
+
+    def test_headless_run_from_set_state(self):
+        class RecordingPlayer(RandomPlayer):
+            def policy(self, decoded_state):
+                seen.append((decoded_state, sim.game_state.make_state()))
+                return super().policy(decoded_state)
+
+        seen = []
+        sim = GameSimulator([RecordingPlayer(0, seed=1), RecordingPlayer(1, seed=2)])
+        sim.game_state.state = np.array([15,2,3,4,5,3,50,51,52,53,54,52])
+        sim.run(headless=True)
+
+        assert seen[0][0][0] == (1, 2)
+        for decoded_state, expected in seen:
+            assert decoded_state == expected
+
+    def test_headless_run(self):
+        log = MoveLog()
+        players = [RandomPlayer(0, seed=1), RandomPlayer(1, seed=2)]
+        report = run_headless_games(players, 3, move_log=log)
+
+        assert len(report.results) == 3
+        assert report.games_per_second > 0
+        assert report.plies == len(log)
+        columns = log.as_arrays()
+        assert list(np.unique(columns["game"])) == [0, 1, 2]
+        assert np.all(columns["player"] == columns["round"] % 2)
+
+        ## Replaying the log of the first game ends in the reported termination state
+        board = BoardState()
+        game = columns["game"] == 0
+        for player_idx, idx, pos in zip(columns["player"][game], columns["relative_idx"][game], columns["position"][game]):
+            assert not board.is_termination_state()
+            board.update(player_idx * 6 + idx, pos)
+        assert board.is_termination_state()
+        assert report.results[0] == (len(columns["round"][game]) - 1, ["WHITE", "BLACK"][player_idx], "No issues")
+
+    def test_tournament(self, tmp_path):
+        register_player("seeded", lambda player_idx, seed: RandomPlayer(player_idx, seed=seed + 100))
+        tournament = Tournament(["random", "seeded"], out_dir=str(tmp_path), n_workers=2, shard_size=3)
+        results = list(tournament.play(2, seed=7))
+
+        assert len(results) == 8
+        assert sorted(result.game for result in results) == list(range(8))
+        assert all(stats.games == 2 for stats in tournament.stats.values())
+        assert sum(sum(stats.wins) for stats in tournament.stats.values()) == 8
+        assert len(tournament.shards) == 3
+
+        games, moves = load_shards(tournament.shards)
+        assert sorted(games["game"]) == list(range(8))
+        for game in games:
+            game_moves = moves[moves["game"] == game["game"]]
+            assert len(game_moves) == game["rounds"] + 1 - game["invalid"]
+            board = BoardState()
+            for move in np.sort(game_moves, order="round"):
+                board.update(move["player"] * 6 + move["relative_idx"], move["position"])
+            assert board.is_termination_state() == (WINNERS[game["winner"]] != "DRAW")
+
+        with pytest.raises(ValueError):
+            Tournament(["nobody"])
+
+    def test_tournament_round_limit(self, tmp_path):
+        ## Deterministic self-play repeats positions forever without a round limit
+        register_player("ab_fast", lambda player_idx, seed: AlphaBetaPlayer(player_idx, time_budget=None, node_budget=300))
+        tournament = Tournament(["ab_fast"], out_dir=str(tmp_path), n_workers=1, max_rounds=40)
+        stats = tournament.run(1)[("ab_fast", "ab_fast")]
+
+        assert stats.wins == [0, 0, 1] and stats.draw_rate == 1.0 and stats.invalid == 0
+        games, moves = load_shards(tournament.shards)
+        assert WINNERS[games["winner"][0]] == "DRAW"
+        assert len(moves) == 40
+
+        sim = GameSimulator([RandomPlayer(0, seed=1), RandomPlayer(1, seed=2)])
+        assert sim.run(headless=True, max_rounds=1) == (0, "DRAW", "No issues")
+
+    @pytest.mark.parametrize("player_idx,state,winning_action", [
+        (0, [0,2,3,4,49,0,50,51,52,53,54,52], (5,49)),
+        (1, [1,2,3,4,5,3,0,49,52,53,54,49], (5,0)),
+    ])
+    def test_alpha_beta_player(self, player_idx, state, winning_action):
+        board = BoardState()
+        board.state = np.array(state)
+
+        player = AlphaBetaPlayer(player_idx, time_budget=None, node_budget=2000)
+        action, value = player.policy(board.decode_state)
+        assert action == winning_action
+        assert value > 0
+        assert player.nodes <= 2001
+
+        for node_budget in [1, 50]:
+            action, _ = AlphaBetaPlayer(player_idx, time_budget=None, node_budget=node_budget).policy(BoardState().decode_state)
+            assert action in GameSimulator(None).generate_valid_actions(player_idx)
+
+    @pytest.mark.parametrize("player_idx,state,winning_action", [
+        (0, [0,2,3,4,49,0,50,51,52,53,54,52], (5,49)),
+        (1, [1,2,3,4,5,3,0,49,52,53,54,49], (5,0)),
+    ])
+    def test_mcts_player(self, player_idx, state, winning_action):
+        board = BoardState()
+        board.state = np.array(state)
+
+        player = MCTSPlayer(player_idx, seed=0, simulations=256, max_rollout_plies=10)
+        action, value = player.policy(board.decode_state)
+        assert action == winning_action
+        assert value == 1.0
+        assert player.rollouts >= 256
+        assert player.rollouts_per_second > 0
+
+    def test_mcts_tree_reuse(self):
+        sim = GameSimulator(None)
+        player = MCTSPlayer(0, seed=0, simulations=512, max_rollout_plies=10)
+        action, _ = player.policy(sim.game_state.decode_state)
+        sim.update(action, 0)
+        reply = player.root.children[action]
+        assert reply.children
+        reply_action = max(reply.children, key=lambda a: reply.children[a].visits)
+        sim.update(reply_action, 1)
+
+        subtree = reply.children[reply_action]
+        visits = subtree.visits
+        player.policy(list(sim.game_state.decode_state))
+        assert player.root is subtree
+        assert player.root.parent is None
+        assert player.root.visits >= visits + 512
+
+    def test_random_playouts(self):
+        states = np.array([BoardState().state] * 6 + [[0,2,3,4,48,49,50,51,52,53,54,52]])
+        players = np.array([0, 1, 0, 1, 0, 1, 1])
+        scores = random_playouts(states, players, np.random.default_rng(0), max_plies=300)
+        assert set(scores) <= {0.0, 0.5, 1.0}
+
+        ## Past the deadline no ply is played and every game is a draw
+        scores = random_playouts(states, players, np.random.default_rng(0), deadline=time.perf_counter())
+        assert np.all(scores == 0.5)
+        player = MCTSPlayer(0, seed=0, simulations=None, time_budget=0.05)
+        start = time.perf_counter()
+        player.policy(BoardState().decode_state)
+        assert time.perf_counter() - start < 0.05 + 0.02
+
+        ## White's ball is on the last row in the last state, but stranded, so it is not terminal
+        assert not termination_batch(states)[-1]
+        sim = GameSimulator(None)
+        for s in states:
+            sim.game_state.state = s.copy()
+            assert termination_batch(s)[0] == sim.game_state.is_termination_state()
+
+    def test_tablebase(self, tmp_path):
+        base = [1,2,3,4,5,3,50,51,52,53,54,52]
+        path = str(tmp_path / "tb.npy")
+        table = Tablebase(path, base, (4, 5))
+        table.build(n_workers=1, max_level=3)
+        assert table.level == 3 and not table.complete
+
+        ## Resuming in another process pool finishes the same table as a single build
+        table = Tablebase(path, base, (4, 5))
+        table.build(n_workers=2)
+        assert table.complete
+        reference = Tablebase(str(tmp_path / "ref.npy"), base, (4, 5))
+        reference.build(n_workers=1)
+        assert np.array_equal(table.values, reference.values)
+
+        ## A crash after a level's values are flushed but before its metadata is saved redoes
+        ## that level on resume, which must not end the build
+        crashed = Tablebase(str(tmp_path / "crash.npy"), base, (4, 5))
+        crashed.build(n_workers=1, max_level=3)
+        crashed.level = 2
+        crashed._save_metadata()
+        crashed = Tablebase(str(tmp_path / "crash.npy"), base, (4, 5))
+        crashed.build(n_workers=1)
+        assert crashed.complete and crashed.level == reference.level
+        assert np.array_equal(crashed.values, reference.values)
+
+        ## Every decided value is one more than the best reply
+        values = np.asarray(table.values)
+        for idx in np.flatnonzero(values > 0)[::25]:
+            packed = table.packed(int(idx))
+            assert table.index(packed) == idx
+            children = [table.index(child) for child in table.children(packed)]
+            replies = [values[child] for child in children if child >= 0]
+            if values[idx] % 2:
+                assert values[idx] - 1 == min(v for v in replies if v >= 0 and v % 2 == 0)
+            else:
+                assert all(v >= 0 and v % 2 for v in replies)
+                assert values[idx] - 1 == max(replies)
+
+        board = [1,2,3,4,49,0,50,51,52,53,54,52]
+        assert table.probe(board, 0) == 1
+        assert table.probe([1,2,3,4,49,49,50,51,52,53,54,52], 1) == 0
+        assert table.probe([0] + board[1:], 0) is None
+
+        player = AlphaBetaPlayer(0, time_budget=None, max_depth=2, tablebase=table)
+        decoded = [(pos % 7, pos // 7) for pos in board]
+        assert player.policy(decoded) == ((5, 49), WIN - 1)
+
+        ## A win in 3 of the class game is only a leaf score: black escapes it in the full game
+        ## by moving a frozen block, so deeper searches must not report a proven win
+        decoded = [(pos % 7, pos // 7) for pos in [1,2,3,4,36,0,50,51,52,53,54,52]]
+        assert table.probe([1,2,3,4,36,0,50,51,52,53,54,52], 0) == 3
+        player = AlphaBetaPlayer(0, time_budget=None, max_depth=1, tablebase=table)
+        assert player.policy(decoded) == ((4, 49), _TABLEBASE_SCORE - 2)
+        player = AlphaBetaPlayer(0, time_budget=None, max_depth=3, tablebase=table)
+        assert player.policy(decoded)[1] < _TABLEBASE_SCORE
+
+        with pytest.raises(ValueError):
+            Tablebase(path, base, (3, 5))
+
+    def test_is_legal_action(self):
+        sim = GameSimulator(None)
+        sim.game_state.update(0, 14)
+        sim.game_state.update(6, 37)
+        for player_idx in (0, 1):
+            valid = set(sim.generate_valid_actions(player_idx))
+            for action in [(idx, pos) for idx in range(7) for pos in range(-1, 57)]:
+                assert sim.is_legal_action(action, player_idx) == (action in valid)
+        assert not sim.is_legal_action(None, 0)
+        assert not sim.is_legal_action((5,), 0)
+
+    def test_state_is_read_only(self):
+        sim = GameSimulator(None)
+        with pytest.raises(ValueError):
+            sim.game_state.state[0] = 20
+
+        state = sim.game_state.state.copy()
+        sim.game_state.state = state
+        state[0] = 20
+        assert sim.game_state.state[0] == 1
+        assert sim.generate_valid_actions(0) == GameSimulator(None).generate_valid_actions(0)
+
+    def test_zobrist_keys(self):
+        board = BoardState()
+        assert board.zobrist == zobrist_key(board.state)
+
+        for idx, pos in [(0, 14), (5, 4), (6, 37), (0, 1)]:
+            board.update(idx, pos)
+            assert board.zobrist == zobrist_key(board.state)
+
+        board.state = np.array([1,2,3,4,5,3,50,51,52,53,54,52])
+        assert board.zobrist == zobrist_key(BoardState().state)
+
+        key = pack_state(board.state, 1)
+        for action, child, child_zobrist in zobrist_successors(key, zobrist_key(board.state, 1)):
+            board_state, player_idx = unpack_state(child)
+            assert child_zobrist == zobrist_key(board_state, player_idx)
+
+    def test_zobrist_table_collision(self):
+        table = ZobristTable()
+        table.put(7, 100, "a")
+        table.put(7, 200, "b")
+        assert table.get(7, 100) == "a"
+        assert table.get(7, 200) == "b"
+        assert table.get(7, 300) is None
+        table.put(7, 100, "c")
+        assert table.get(7, 100) == "c"
+        assert len(table) == 2
+
+    def test_update_undo_caches(self):
+        sim = GameSimulator(None)
+        board = sim.game_state
+        initial_actions = sim.generate_valid_actions(0)
+
+        ## Moving a white block across black's back row opens and blocks black's pass lanes
+        moves = [(0, 14), (6, 37), (0, 29), (1, 44), (1, 51), (5, 51)]
+        for idx, pos in moves:
+            board.update(idx, pos)
+            fresh = GameSimulator(None)
+            fresh.game_state.state = board.state.copy()
+            for player_idx in (0, 1):
+                assert sim.generate_valid_actions(player_idx) == fresh.generate_valid_actions(player_idx)
+
+        for _ in moves:
+            board.undo()
+        assert np.all(board.state == BoardState().state)
+        assert board.decode_state == BoardState().decode_state
+        assert board.zobrist == BoardState().zobrist
+        assert sim.generate_valid_actions(0) == initial_actions
+
+    @pytest.mark.parametrize("alg", ["heap_a_star", "lazy_bfs"])
+    def test_early_goal_test(self, alg):
+        b1 = BoardState()
+        b2 = BoardState()
+        b2.update(0, 23)
+
+        for early_goal_test in [False, True]:
+            gsp = GameStateProblem(b1, b2, 0)
+            gsp.set_search_alg(alg, early_goal_test=early_goal_test)
+            sln = gsp.search_alg_fnc()
+            assert len(sln) == 5
+            assert sln[2][1] == (0, 23)
+            assert sln[4] == (tuple((tuple(b2.state), 0)), None)
+
+    def test_iter_successors(self):
+        board = BoardState()
+        board.update(2, 17)
+        key = pack_state(board.state, 0)
+        assert sorted(iter_successors(key)) == sorted(successors(key))
+
+    def test_node_store(self):
+        nodes = NodeStore(capacity=4)
+        keys = [pack_state([i % 56] * 11 + [i // 56], i % 2) for i in range(500)]
+        for i, key in enumerate(keys):
+            assert nodes.find(key) == -1
+            assert nodes.add(key, i - 1, (i % 6) << 6 | (i % 56), i) == i
+
+        assert len(nodes) == 500
+        for i, key in enumerate(keys):
+            assert nodes.find(key) == i
+            assert nodes.key(i) == key
+        assert nodes.path(2) == [(keys[0], (1, 1)), (keys[1], (2, 2)), (keys[2], None)]
+
+    def test_vector_bfs_chunks(self):
+        b1 = BoardState()
+        b2 = BoardState()
+        b2.update(0, 23)
+        b2.update(6, 37)
+
+        gsp = GameStateProblem(b1, b2, 0)
+        sln = gsp.vector_bfs_algorithm(memory_budget=1 << 16)
+        assert len(sln) == len(gsp.vector_bfs_algorithm())
+        for (state, action), (next_state, _) in zip(sln, sln[1:]):
+            assert gsp.execute(state, action) == next_state
+        assert sln[-1] == (tuple((tuple(b2.state), 1)), None)
+
+    @pytest.mark.parametrize("memory_budget,n_buckets", [(1 << 16, 16), (1 << 10, 2)])
+    def test_external_bfs(self, tmp_path, memory_budget, n_buckets):
+        b1 = BoardState()
+        b2 = BoardState()
+        b2.update(0, 23)
+        b2.update(6, 37)
+
+        gsp = GameStateProblem(b1, b2, 0)
+        sln = gsp.external_bfs_algorithm(scratch_dir=tmp_path, memory_budget=memory_budget, n_buckets=n_buckets)
+
+        assert len(sln) == 4
+        assert sln[-1] == (tuple((tuple(b2.state), 1)), None)
+        for (state, action), (next_state, _) in zip(sln, sln[1:]):
+            assert gsp.execute(state, action) == next_state
+        assert list(tmp_path.iterdir()) == []
+
     def test_initial_state(self):
         """
         Confirms the initial state of the game board
@@ -70,6 +634,46 @@ class TestSearch:
         assert (0,6) not in generated_actions
         assert (4,0) not in generated_actions
 
+    @pytest.mark.parametrize("pos,targets", [
+        ((0,0), [(2,1),(1,2)]),
+        ((6,7), [(4,6),(5,5)]),
+        ((3,0), [(1,1),(5,1),(2,2),(4,2)]),
+        ((3,4), [(1,3),(1,5),(5,3),(5,5),(2,2),(4,2),(2,6),(4,6)]),
+    ])
+    def test_single_piece_actions(self, pos, targets):
+        board = BoardState()
+        board.update(0, board.encode_single_pos(pos))
+        expected = [board.encode_single_pos(cr) for cr in targets]
+        assert Rules.single_piece_actions(board, 0) == expected
+
+    def test_occupancy(self):
+        board = BoardState()
+        assert board.occupancy(0) == sum(1 << pos for pos in [1,2,3,4,5])
+        assert board.occupancy(1) == sum(1 << pos for pos in [50,51,52,53,54])
+
+    def test_generate_actions_batch(self):
+        rng = np.random.default_rng(0)
+        states = rng.integers(0, 56, (200, 12))
+        states[::2, 5] = states[::2, 0]
+        states[::2, 11] = states[::2, 8]
+        states[0] = BoardState().state
+        players = rng.integers(0, 2, 200)
+
+        offsets, relative_idx, positions, children = GameSimulator.generate_valid_actions_batch(states, players)
+        assert len(offsets) == len(states) + 1
+
+        for i in range(len(states)):
+            sim = GameSimulator(None)
+            sim.game_state.state = states[i].copy()
+            expected = sim.generate_valid_actions(players[i])
+            rows = range(offsets[i], offsets[i+1])
+            assert [(relative_idx[r], positions[r]) for r in rows] == expected
+
+            for r in rows:
+                child = states[i].copy()
+                child[players[i] * 6 + relative_idx[r]] = positions[r]
+                assert np.all(children[r] == child)
+
     ## NOTE: You are highly encouraged to add failing test cases here
     ## in order to test your validate_action implementation. To add an
     ## invalid action, fill in the action tuple, the player_idx, the
@@ -338,6 +942,14 @@ class TestSearch:
             set([(0,0),(2,0),(0,2),(2,2)]),
             0
         ),
+        (
+            [
+                (0,0),(0,3),(3,3),(6,6),(6,0),(0,0),
+                (1,1),(3,0),(5,1),(6,4),(2,7),(2,7)
+            ],
+            set([(0,3),(3,3),(6,6)]),
+            0
+        ),
     ]) 
     def test_ball_reachability(self, state, reachable, player):
         board = BoardState()
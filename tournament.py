@@ -0,0 +1,195 @@
+"""
+Self-play tournaments between registered players on a process pool.
+
+Players are registered by name with a factory, called as factory(player_idx, seed) to build
+the player for one side of one game. Every game is played headless (see GameSimulator.run)
+in a worker process, and a game still going after max_rounds rounds is a draw. Finished games stream back to the parent, which updates per matchup
+statistics and collects the moves into compressed .npz shards of NumPy structured arrays:
+    - "moves": one record per ply with the fields of MOVE_DTYPE
+    - "games": one record per game with the fields of GAME_DTYPE
+
+Worker processes are forked from the parent, so players registered before a tournament is
+played are available in the workers.
+"""
+
+import collections
+import itertools
+import multiprocessing as mp
+import os
+
+import numpy as np
+
+from game import GameSimulator, MoveLog
+from players import AlphaBetaPlayer, MCTSPlayer, RandomPlayer
+
+MOVE_DTYPE = np.dtype([("game", np.int32), ("round", np.int32), ("player", np.uint8),
+                       ("relative_idx", np.uint8), ("position", np.uint8)])
+GAME_DTYPE = np.dtype([("game", np.int32), ("white", "U32"), ("black", "U32"), ("rounds", np.int32),
+                       ("winner", np.uint8), ("invalid", np.bool_)])
+
+## Outcomes as stored in GAME_DTYPE["winner"] and counted in MatchupStats.wins
+WINNERS = ("WHITE", "BLACK", "DRAW")
+
+DEFAULT_MAX_ROUNDS = 500
+
+PLAYERS = {
+    "random": RandomPlayer,
+    "alphabeta": AlphaBetaPlayer,
+    "mcts": MCTSPlayer,
+}
+
+
+def register_player(name, factory):
+    """
+    Registers factory(player_idx, seed) under name for use in tournaments
+    """
+    PLAYERS[name] = factory
+
+
+GameResult = collections.namedtuple("GameResult", ["game", "white", "black", "rounds", "winner", "status", "moves"])
+
+
+class MatchupStats:
+    """
+    Win and round statistics of the games between one white and one black player; wins counts
+    the white wins, black wins and draws
+    """
+
+    def __init__(self):
+        self.games = 0
+        self.wins = [0, 0, 0]
+        self.invalid = 0
+        self.total_rounds = 0
+        self.min_rounds = None
+        self.max_rounds = None
+
+    def add(self, result):
+        self.games += 1
+        self.wins[WINNERS.index(result.winner)] += 1
+        self.invalid += result.status != "No issues"
+        self.total_rounds += result.rounds
+        if self.min_rounds is None or result.rounds < self.min_rounds:
+            self.min_rounds = result.rounds
+        if self.max_rounds is None or result.rounds > self.max_rounds:
+            self.max_rounds = result.rounds
+
+    @property
+    def white_win_rate(self):
+        return self.wins[0] / self.games if self.games else 0.0
+
+    @property
+    def draw_rate(self):
+        return self.wins[2] / self.games if self.games else 0.0
+
+    @property
+    def mean_rounds(self):
+        return self.total_rounds / self.games if self.games else 0.0
+
+    def __repr__(self):
+        return (f"MatchupStats(games={self.games}, wins={self.wins[:2]}, draws={self.wins[2]}, invalid={self.invalid}, "
+                f"mean_rounds={self.mean_rounds:.1f})")
+
+
+def _play_game(job):
+    game_idx, white, black, seed, max_rounds = job
+    players = [PLAYERS[white](0, seed), PLAYERS[black](1, seed + 1)]
+    log = MoveLog()
+    rounds, winner, status = GameSimulator(players).run(headless=True, move_log=log, max_rounds=max_rounds)
+
+    columns = log.columns
+    moves = np.zeros(len(log), dtype=MOVE_DTYPE)
+    moves["game"] = game_idx
+    for name in ("round", "player", "relative_idx", "position"):
+        moves[name] = columns[name]
+    return GameResult(game_idx, white, black, rounds, winner, status, moves)
+
+
+class Tournament:
+    """
+    Plays every ordered pair of the named players against each other, including self-play
+
+    Inputs:
+        - players, a list of registered player names
+        - out_dir, a directory for the .npz shards; no moves are kept if it is None
+        - n_workers, the number of worker processes (default: one per CPU)
+        - shard_size, the number of games written to each shard
+        - max_rounds, the number of rounds after which a game is a draw (None for no limit, which
+          never ends between players that repeat positions)
+
+    stats maps (white, black) to the MatchupStats of that matchup and shards lists the paths of
+    the shards written so far.
+    """
+
+    def __init__(self, players, out_dir=None, n_workers=None, shard_size=1000, max_rounds=DEFAULT_MAX_ROUNDS):
+        unknown = [name for name in players if name not in PLAYERS]
+        if unknown:
+            raise ValueError(f"Unknown players {unknown}, register them with register_player")
+        self.players = list(players)
+        self.out_dir = out_dir
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.shard_size = shard_size
+        self.max_rounds = max_rounds
+        self.stats = {matchup: MatchupStats() for matchup in itertools.product(self.players, repeat=2)}
+        self.shards = []
+        self._buffer = []
+
+    def play(self, games_per_matchup, seed=0, chunksize=1):
+        """
+        Plays games_per_matchup games of every matchup and yields each GameResult as it
+        finishes, after adding it to stats. Game g uses seeds seed + 2g and seed + 2g + 1
+        for its players.
+        """
+        matchups = [matchup for matchup in self.stats for _ in range(games_per_matchup)]
+        first_game = sum(stats.games for stats in self.stats.values())
+        jobs = ((first_game + i, white, black, seed + 2 * (first_game + i), self.max_rounds)
+                for i, (white, black) in enumerate(matchups))
+
+        with mp.Pool(self.n_workers) as pool:
+            for result in pool.imap_unordered(_play_game, jobs, chunksize):
+                self.stats[result.white, result.black].add(result)
+                if self.out_dir is not None:
+                    self._buffer.append(result)
+                    if len(self._buffer) >= self.shard_size:
+                        self.flush()
+                yield result
+        self.flush()
+
+    def run(self, games_per_matchup, seed=0, chunksize=1):
+        """
+        Plays the whole tournament and returns stats
+        """
+        for _ in self.play(games_per_matchup, seed, chunksize):
+            pass
+        return self.stats
+
+    def flush(self):
+        """
+        Writes the buffered games to a new shard
+        """
+        if not self._buffer:
+            return
+        games = np.zeros(len(self._buffer), dtype=GAME_DTYPE)
+        for i, result in enumerate(self._buffer):
+            games[i] = (result.game, result.white, result.black, result.rounds,
+                        WINNERS.index(result.winner), result.status != "No issues")
+        moves = np.concatenate([result.moves for result in self._buffer])
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"shard_{len(self.shards):05d}.npz")
+        np.savez_compressed(path, games=games, moves=moves)
+        self.shards.append(path)
+        self._buffer = []
+
+
+def load_shards(paths):
+    """
+    Returns the concatenated (games, moves) structured arrays of the given shard paths
+    """
+    games = []
+    moves = []
+    for path in paths:
+        with np.load(path) as shard:
+            games.append(shard["games"])
+            moves.append(shard["moves"])
+    return (np.concatenate(games) if games else np.zeros(0, dtype=GAME_DTYPE),
+            np.concatenate(moves) if moves else np.zeros(0, dtype=MOVE_DTYPE))
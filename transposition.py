@@ -0,0 +1,160 @@
+"""
+Bounded transposition table shared by the GameStateProblem instances of one goal.
+
+Entries are keyed by packed state and hold what stays valid for every query towards the goal:
+a lower bound on the distance to the goal (the heuristic estimate, raised to the exact distance
+for states on returned plans) and the state's successor list. g values depend on the initial
+state, so they stay in each search's own tables.
+
+The table holds at most capacity entries. The eviction policy is either
+    - "lru": the least recently used entry is evicted when a new one is added, or
+    - "depth": every state maps to one slot, and a new entry only replaces the slot's occupant
+      if its depth, the stored distance bound, is at least as large. Deep entries stand for
+      larger parts of the search space and are the most expensive to lose. An exact distance
+      from a returned plan is never replaced by an estimate, whatever their depths.
+"""
+
+import collections
+
+from bitboard import successors
+
+POLICIES = ("lru", "depth")
+
+_MASK64 = (1 << 64) - 1
+
+
+def _slot(key: int, capacity: int):
+    h = (key * 0x9E3779B97F4A7C15) & _MASK64
+    return (h ^ (h >> 29)) % capacity
+
+
+class TableEntry:
+    """
+    Distance bound and successor list of one packed state; either may still be None
+    """
+
+    __slots__ = ("h", "exact", "successors")
+
+    def __init__(self):
+        self.h = None
+        self.exact = False
+        self.successors = None
+
+    @property
+    def depth(self):
+        return self.h or 0
+
+
+class TranspositionTable:
+    """
+    Size bounded cache of TableEntry values for the packed goal board goal
+    (GameStateProblem.goal_board), whose distance bounds come from the named heuristic (see
+    GameStateProblem.set_search_alg)
+
+    hits and misses count the lookups that found or did not find a usable value.
+    """
+
+    def __init__(self, goal: int, capacity=1 << 16, policy="lru", heuristic="knight"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown eviction policy {policy!r}, expected one of {POLICIES}")
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.goal = goal
+        self.heuristic_name = heuristic
+        self.capacity = capacity
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        if policy == "lru":
+            self.entries = collections.OrderedDict()
+        else:
+            self.slots = [None] * capacity
+            self.n_entries = 0
+
+    def __len__(self):
+        if self.policy == "lru":
+            return len(self.entries)
+        return self.n_entries
+
+    def get(self, key: int):
+        """
+        Returns the entry of the packed state key, or None if it is not stored
+        """
+        if self.policy == "lru":
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+        occupant = self.slots[_slot(key, self.capacity)]
+        if occupant is not None and occupant[0] == key:
+            return occupant[1]
+        return None
+
+    def put(self, key: int, entry: TableEntry):
+        """
+        Stores entry for the packed state key, evicting according to the policy. With the
+        "depth" policy the entry is dropped if its slot holds a deeper entry of another state, or
+        an exact one while entry is not exact.
+        """
+        if self.policy == "lru":
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+            return
+        slot = _slot(key, self.capacity)
+        occupant = self.slots[slot]
+        if occupant is None:
+            self.n_entries += 1
+        elif occupant[0] != key:
+            if occupant[1].exact and not entry.exact:
+                return
+            if occupant[1].exact == entry.exact and occupant[1].depth > entry.depth:
+                return
+        self.slots[slot] = (key, entry)
+
+    def _entry(self, key: int):
+        entry = self.get(key)
+        if entry is None:
+            entry = TableEntry()
+        return entry
+
+    def heuristic(self, key: int, heuristic_fnc):
+        """
+        Returns the stored distance bound of the packed state key, computing it with
+        heuristic_fnc and storing it on a miss
+        """
+        entry = self._entry(key)
+        if entry.h is not None:
+            self.hits += 1
+            return entry.h
+        self.misses += 1
+        entry.h = heuristic_fnc(key)
+        self.put(key, entry)
+        return entry.h
+
+    def successors(self, key: int):
+        """
+        Returns the stored list of (action, child) of the packed state key, generating and
+        storing it on a miss
+        """
+        entry = self._entry(key)
+        if entry.successors is not None:
+            self.hits += 1
+            return entry.successors
+        self.misses += 1
+        entry.successors = list(successors(key))
+        self.put(key, entry)
+        return entry.successors
+
+    def store_plan(self, keys):
+        """
+        Records the exact distances of the packed states keys of an optimal plan, whose last
+        state is a goal
+        """
+        n_moves = len(keys) - 1
+        for i, key in enumerate(keys):
+            entry = self._entry(key)
+            entry.h = n_moves - i
+            entry.exact = True
+            self.put(key, entry)